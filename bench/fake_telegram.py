@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""aiogram session that records sends instead of calling Telegram.
+
+Enforces Telegram-like limits (global msgs/sec and per-chat spacing) by raising
+TelegramRetryAfter, so the delivery engine's throttling path is exercised.
+"""
+from __future__ import annotations
+import datetime as dt
+import time
+from typing import Any, AsyncGenerator, Dict, IO, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+BENCH_TOKEN = "123456:BENCH-token"
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(
+        self, global_rate: float = 30.0, per_chat_interval: float = 1.0, log: Optional[str] = None, **kwargs: Any
+    ) -> None:
+        super().__init__(**kwargs)
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.sent: List[Tuple[float, int]] = []
+        self.throttled = 0
+        self._window: List[float] = []
+        self._chat_last: Dict[int, float] = {}
+        self._message_id = 0
+        # one "chat_id<TAB>text" line per accepted send, flushed immediately so a killed process keeps its record
+        self._log: Optional[IO[str]] = open(log, "a", encoding="utf-8") if log else None
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        if not isinstance(method, SendMessage):
+            return True
+        now = time.monotonic()
+        chat_id = int(method.chat_id)
+        # sliding one-second window for the global limit
+        self._window = [t for t in self._window if now - t < 1.0]
+        if self.global_rate and len(self._window) >= self.global_rate:
+            self.throttled += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        last = self._chat_last.get(chat_id)
+        if last is not None and now - last < self.per_chat_interval:
+            self.throttled += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        self._window.append(now)
+        self._chat_last[chat_id] = now
+        self.sent.append((now, chat_id))
+        if self._log is not None:
+            self._log.write(f"{chat_id}\t{method.text.replace(chr(10), ' ')}\n")
+            self._log.flush()
+        self._message_id += 1
+        return Message(
+            message_id=self._message_id,
+            date=dt.datetime.now(dt.timezone.utc),
+            chat=Chat(id=chat_id, type="private"),
+            text=method.text,
+        )
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        if False:  # pragma: no cover - nothing to stream
+            yield b""
+
+    async def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def fake_bot(
+    global_rate: float = 30.0, per_chat_interval: float = 1.0, log: Optional[str] = None
+) -> Tuple[Bot, FakeTelegramSession]:
+    session = FakeTelegramSession(global_rate=global_rate, per_chat_interval=per_chat_interval, log=log)
+    return Bot(token=BENCH_TOKEN, session=session), session
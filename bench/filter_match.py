@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Per-event cost of matching compiled subscription filters.
+
+    python -m bench.filter_match --subscriptions 20000 --events 2000
+
+Builds a SubscriptionIndex of random filters (type, tld, len, score, name~) and times
+``match`` per event, split into the index lookup and the fan-out to user ids.
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from features.filters import FilterSyntaxError, parse_filter, split_domain
+from features.scoring import heuristic_score
+from features.subscriptions import SubscriptionIndex, event_alias
+
+TYPES = ("LISTED", "PURCHASED", "EXPIRING")
+EVENT_TYPES = ("NAME_TOKEN_LISTED", "NAME_TOKEN_PURCHASED", "EXPIRING", "LISTED")
+TLDS = ("ai", "io", "com", "xyz", "app")
+KEYWORDS = ("crypto", "bit", "coin", "meta", "ai", "dao", "nft", "defi", "web", "pay")
+
+
+def random_filter(rng: random.Random) -> str:
+    terms = []
+    if rng.random() < 0.8:
+        terms.append(f"type:{rng.choice(TYPES)}")
+    if rng.random() < 0.4:
+        terms.append(f"tld:{rng.choice(TLDS)}")
+    if rng.random() < 0.4:
+        terms.append(f"len<={rng.randint(3, 10)}")
+    if rng.random() < 0.3:
+        terms.append(f"score>={rng.randint(1, 4)}")
+    if rng.random() < 0.3:
+        terms.append(f"name~{rng.choice(KEYWORDS)}")
+    return " ".join(terms)
+
+
+def random_domain(rng: random.Random) -> str:
+    label = rng.choice(KEYWORDS) if rng.random() < 0.5 else ""
+    label += "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(1, 8)))
+    return f"{label}.{rng.choice(TLDS)}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscriptions", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = SubscriptionIndex()
+    start = time.perf_counter()
+    for sub_id in range(args.subscriptions):
+        try:
+            flt = parse_filter(random_filter(rng))
+        except FilterSyntaxError:
+            continue
+        index.add(sub_id, rng.randrange(args.users), flt)
+    build = time.perf_counter() - start
+    events = []
+    for _ in range(args.events):
+        domain = random_domain(rng)
+        events.append((rng.choice(EVENT_TYPES), domain, heuristic_score(domain)))
+
+    matcher = index._matcher
+    start = time.perf_counter()
+    for ev_type, domain, score in events:
+        name, tld = split_domain(domain)
+        matcher.match((ev_type, event_alias(ev_type)), name, tld, score)
+    lookup = time.perf_counter() - start
+    matched = 0
+    start = time.perf_counter()
+    for ev_type, domain, score in events:
+        matched += len(index.match(ev_type, domain, score))
+    total = time.perf_counter() - start
+
+    print(f"subscriptions: {len(index)} (indexed in {build:.3f}s)")
+    print(f"index lookup:  {lookup / len(events) * 1e6:.1f} us/event")
+    print(f"match total:   {total / len(events) * 1e6:.1f} us/event, {matched / len(events):.1f} users/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Poller load test: N events x M subscribers against a local stand-in Doma API and fake Telegram.
+
+    python -m bench.loadtest --events 5000 --subscribers 1000 --latency-ms 20 --error-rate 0.01
+
+Reports ingest rate (events/s), poll cycle latency percentiles, delivery rate and peak memory.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from infra.config import settings
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def _seed_subscriptions(count: int, digest: str = "") -> None:
+    from data.models import Subscription, get_session_factory
+    from features.filters import parse_filter
+
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        # alternate LISTED / PURCHASED so each event fans out to about half the subscribers
+        filters = [("LISTED" if i % 2 == 0 else "PURCHASED") + (f" digest:{digest}" if digest else "") for i in range(count)]
+        s.add_all(
+            Subscription(user_id=100_000 + i, filter_text=ft, filter_compiled=parse_filter(ft).to_json())
+            for i, ft in enumerate(filters)
+        )
+        await s.commit()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # configure before any component reads settings
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="doma-bench-"), "bench.db")
+    settings.database_url = f"sqlite:///{db_path}"
+    settings.journal_dir = os.path.join(os.path.dirname(db_path), "journal") if not args.no_journal else ""
+    settings.doma_simulate = False
+    settings.alerts_dry_run = False
+    settings.poll_page_size = args.page_size
+    settings.poll_min_interval_seconds = 0.5
+    settings.poll_interval_seconds = 1
+    settings.tg_global_rate = args.tg_rate
+    settings.tg_per_chat_interval = args.tg_chat_interval
+    settings.send_concurrency = args.send_concurrency
+    if args.pipeline_workers:
+        settings.pipeline_workers = args.pipeline_workers
+
+    from bench.fake_telegram import fake_bot
+    from bench.stub_doma import StubDomaAPI
+    from data.models import init_db
+    from doma.client import DomaClient
+    from features.alerts import AlertsService
+    from features.poller import Poller
+
+    api = StubDomaAPI(args.events, latency_ms=args.latency_ms, error_rate=args.error_rate)
+    settings.doma_base_url = await api.start()
+    await init_db(settings.database_url)
+    await _seed_subscriptions(args.subscribers, args.digest)
+
+    bot, session = fake_bot(global_rate=args.tg_rate, per_chat_interval=args.tg_chat_interval)
+    client = DomaClient()
+    poller = Poller(bot=bot, alerts=AlertsService(), client=client)
+
+    cycles: List[float] = []
+    poll_once = poller._poll_once
+
+    async def timed_poll_once(kind: str):
+        t0 = time.perf_counter()
+        try:
+            return await poll_once(kind)
+        finally:
+            cycles.append(time.perf_counter() - t0)
+
+    poller._poll_once = timed_poll_once  # type: ignore[method-assign]
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await poller.start()
+    deadline = start + args.timeout
+    ingest_elapsed = process_elapsed = None
+    try:
+        while time.perf_counter() < deadline:
+            if ingest_elapsed is None and api.acked_id >= args.events:
+                ingest_elapsed = time.perf_counter() - start
+            if (
+                process_elapsed is None
+                and ingest_elapsed is not None
+                and (poller.journal is None or poller.journal.backlog_bytes() == 0)
+            ):
+                process_elapsed = time.perf_counter() - start
+                if not args.drain:
+                    break
+            if (
+                ingest_elapsed is not None
+                and await poller.outbox.pending() == 0
+                and await poller.outbox.digest_pending() == 0
+                and (poller.journal is None or poller.journal.backlog_bytes() == 0)
+            ):
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        total_elapsed = time.perf_counter() - start
+        await poller.stop()
+        await api.stop()
+    peak_traced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    ingest = ingest_elapsed or total_elapsed
+    processed = process_elapsed or total_elapsed
+    sent = len(session.sent)
+    return {
+        "events": args.events,
+        "subscribers": args.subscribers,
+        "page_size": args.page_size,
+        "completed": ingest_elapsed is not None,
+        "ingest_seconds": round(ingest, 3),
+        "ack_events_per_sec": round(api.acked_id / ingest, 1) if ingest else 0.0,
+        "process_seconds": round(processed, 3),
+        "events_per_sec": round(poller.processed_total / processed, 1) if processed else 0.0,
+        "cycles": len(cycles),
+        "cycle_p50_ms": round(_pct(cycles, 0.5) * 1000, 2),
+        "cycle_p95_ms": round(_pct(cycles, 0.95) * 1000, 2),
+        "cycle_p99_ms": round(_pct(cycles, 0.99) * 1000, 2),
+        "messages_sent": sent,
+        "messages_per_sec": round(sent / total_elapsed, 1) if total_elapsed else 0.0,
+        "tg_throttled": session.throttled,
+        "outbox_pending": await poller.outbox.pending(),
+        "digest_alerts": poller.outbox_worker.digest_items_total,
+        "api_requests": api.requests,
+        "api_errors_injected": api.errors,
+        "poller_errors": poller.error_total,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "traced_peak_mb": round(peak_traced / 2**20, 1) if peak_traced is not None else None,
+        "db": db_path,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--subscribers", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stub API latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub API requests answered 503")
+    parser.add_argument("--tg-rate", type=float, default=30.0, help="fake Telegram global msgs/sec")
+    parser.add_argument("--tg-chat-interval", type=float, default=1.0, help="fake Telegram per-chat spacing")
+    parser.add_argument("--send-concurrency", type=int, default=16)
+    parser.add_argument("--drain", action="store_true", help="also wait for the outbox to empty")
+    parser.add_argument("--pipeline-workers", type=int, default=0,
+                        help="journal consumer workers (default: PIPELINE_WORKERS)")
+    parser.add_argument("--no-journal", action="store_true", help="process pages inline before ack (no event journal)")
+    parser.add_argument("--digest", default="", help="subscribe in digest mode, e.g. 10s or 10s,50")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--tracemalloc", action="store_true", help="trace Python allocations (slower)")
+    parser.add_argument("--db", default="", help="SQLite file (default: fresh temp file)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Several bot replicas sharing one SQLite file: leader failover and sharded delivery.
+
+    python -m bench.replicas --replicas 3 --shards 6 --events 2000 --subscribers 100 --kill-leader-at 0.3
+
+Starts the stand-in Doma API, then N replica processes (fake Telegram, shared DB and journal
+directory). Partway through it SIGKILLs the current poller leader. It reports how long the
+feed stalled, which replica took over, sends per replica, duplicates and missing alerts.
+--lease 0 turns election off, so every replica polls and acks on its own.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from infra.config import settings
+
+
+def _configure(args: argparse.Namespace) -> None:
+    settings.database_url = f"sqlite:///{os.path.join(args.dir, 'bench.db')}"
+    settings.journal_dir = os.path.join(args.dir, "journal")
+    settings.doma_simulate = False
+    settings.alerts_dry_run = False
+    settings.poll_page_size = args.page_size
+    settings.poll_min_interval_seconds = 0.5
+    settings.poll_interval_seconds = 1
+    settings.tg_global_rate = args.tg_rate
+    settings.tg_per_chat_interval = args.tg_chat_interval
+    settings.leader_lease_seconds = args.lease
+    settings.delivery_shards = args.shards
+
+
+async def _child(args: argparse.Namespace) -> None:
+    _configure(args)
+    settings.doma_base_url = args.base_url
+    settings.replica_id = args.replica_id
+
+    from bench.fake_telegram import fake_bot
+    from data.models import init_db
+    from features.alerts import AlertsService
+    from features.poller import Poller
+
+    await init_db(settings.database_url)
+    bot, _ = fake_bot(
+        global_rate=args.tg_rate, per_chat_interval=args.tg_chat_interval,
+        log=os.path.join(args.dir, f"{args.replica_id}.sent"),
+    )
+    poller = Poller(bot=bot, alerts=AlertsService())
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await poller.start()
+    await stop.wait()
+    await poller.stop()
+    await bot.session.close()
+
+
+async def _expected_sends(api: Any, events: int) -> int:
+    from features.scoring import heuristic_score
+    from features.subscriptions import SubscriptionsService
+
+    index = await SubscriptionsService(settings.database_url).get_index()
+    total = 0
+    for i in range(1, events + 1):
+        ev = api._event(i)
+        immediate, digest = index.route(ev["type"], ev["name"], heuristic_score(ev["name"]))
+        total += len(immediate) + len(digest)
+    return total
+
+
+def _read_sends(directory: str, replicas: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+    out: Dict[str, List[Tuple[str, str]]] = {}
+    for rid in replicas:
+        path = os.path.join(directory, f"{rid}.sent")
+        rows: List[Tuple[str, str]] = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                rows = [tuple(line.rstrip("\n").split("\t", 1)) for line in f if "\t" in line]  # type: ignore[misc]
+        out[rid] = rows
+    return out
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    args.dir = args.dir or tempfile.mkdtemp(prefix="doma-replicas-")
+    _configure(args)
+
+    from bench.loadtest import _seed_subscriptions
+    from bench.stub_doma import StubDomaAPI
+    from data.models import init_db, list_leases
+
+    api = StubDomaAPI(args.events, latency_ms=args.latency_ms)
+    base_url = await api.start()
+    await init_db(settings.database_url)
+    await _seed_subscriptions(args.subscribers)
+    expected = await _expected_sends(api, args.events)
+
+    replicas = [f"r{i}" for i in range(args.replicas)]
+    procs: Dict[str, asyncio.subprocess.Process] = {}
+    for rid in replicas:
+        procs[rid] = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bench.replicas", "--child",
+            "--dir", args.dir, "--base-url", base_url, "--replica-id", rid,
+            "--lease", str(args.lease), "--shards", str(args.shards), "--page-size", str(args.page_size),
+            "--tg-rate", str(args.tg_rate), "--tg-chat-interval", str(args.tg_chat_interval),
+        )
+
+    start = time.perf_counter()
+    deadline = start + args.timeout
+    killed = new_leader = None
+    killed_at = stall = None
+    acked_at_kill = 0
+    sent_settled_at = None
+    last_sent = -1
+    try:
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+            now = time.perf_counter()
+            leases = await list_leases("leader:")
+            leader = next((owner for owner, expires in leases.values() if expires > time.time()), None)
+            if killed is None and args.kill_leader_at and leader and api.acked_id >= args.events * args.kill_leader_at:
+                killed, killed_at, acked_at_kill = leader, now, api.acked_id
+                procs[leader].kill()
+                logging.warning("Killed leader %s at ack %d", leader, acked_at_kill)
+            if killed_at is not None and stall is None and api.acked_id > acked_at_kill:
+                stall = now - killed_at
+                new_leader = leader
+            if api.acked_id < args.events:
+                continue
+            # done once every replica's send log stops growing for a few lease periods
+            sent = sum(len(v) for v in _read_sends(args.dir, replicas).values())
+            if sent != last_sent:
+                last_sent, sent_settled_at = sent, now
+            elif now - sent_settled_at > max(3.0, 2 * args.lease) and sent >= expected:
+                break
+    finally:
+        elapsed = time.perf_counter() - start
+        for rid, proc in procs.items():
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGTERM)
+        await asyncio.gather(*(proc.wait() for proc in procs.values()))
+        await api.stop()
+
+    sends = _read_sends(args.dir, replicas)
+    all_sends = [row for rows in sends.values() for row in rows]
+    counts = Counter(all_sends)
+    # chats served by more than one replica (expected only for shards that moved on failover)
+    chat_replicas: Dict[str, set] = {}
+    for rid, rows in sends.items():
+        for chat_id, _ in rows:
+            chat_replicas.setdefault(chat_id, set()).add(rid)
+    return {
+        "replicas": args.replicas,
+        "shards": args.shards,
+        "lease_seconds": args.lease,
+        "events": args.events,
+        "acked": api.acked_id,
+        "poll_requests": api.requests.get("/v1/poll", 0),
+        "killed_leader": killed,
+        "new_leader": new_leader,
+        "failover_stall_seconds": round(stall, 2) if stall is not None else None,
+        "expected_sends": expected,
+        "sends": len(all_sends),
+        "sends_per_replica": {rid: len(rows) for rid, rows in sends.items()},
+        "duplicates": sum(n - 1 for n in counts.values() if n > 1),
+        "missing": max(0, expected - len(counts)),
+        "chats_on_several_replicas": sum(1 for r in chat_replicas.values() if len(r) > 1),
+        "seconds": round(elapsed, 2),
+        "dir": args.dir,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=6, help="DELIVERY_SHARDS")
+    parser.add_argument("--lease", type=float, default=3.0, help="LEADER_LEASE_SECONDS (0: no election)")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stub API latency per request")
+    parser.add_argument("--tg-rate", type=float, default=1000.0, help="fake Telegram msgs/sec per replica")
+    parser.add_argument("--tg-chat-interval", type=float, default=0.0, help="fake Telegram per-chat spacing")
+    parser.add_argument("--kill-leader-at", type=float, default=0.3,
+                        help="SIGKILL the leader once this fraction of events is acked (0: never)")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--dir", default="", help="working directory for the DB, journal and send logs")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--replica-id", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.child:
+        asyncio.run(_child(args))
+        return
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
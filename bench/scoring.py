@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Scoring engine throughput, cold (every name new) and on a feed with repeat names.
+
+    python -m bench.scoring --names 200000 --distinct 20000
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from features.scoring import ScoringEngine
+
+TLDS = (".com", ".ai", ".io", ".xyz", ".eth")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=200000, help="names scored per run")
+    parser.add_argument("--distinct", type=int, default=20000, help="distinct names in the repeat feed")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+    def name() -> str:
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))) + rng.choice(TLDS)
+
+    start = time.perf_counter()
+    engine = ScoringEngine()
+    print(f"tables built in {(time.perf_counter() - start) * 1000:.1f} ms ({len(engine.words)} words)")
+
+    cold = [name() for _ in range(args.names)]
+    uncached = ScoringEngine(cache_size=0)
+    start = time.perf_counter()
+    uncached.score_many(cold)
+    elapsed = time.perf_counter() - start
+    print(f"cold:   {args.names / elapsed:,.0f} names/s")
+
+    pool = [name() for _ in range(args.distinct)]
+    feed = [rng.choice(pool) for _ in range(args.names)]
+    start = time.perf_counter()
+    engine.score_many(feed)
+    elapsed = time.perf_counter() - start
+    print(f"repeat: {args.names / elapsed:,.0f} names/s {engine.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Doma API used by the load-test harness.
+
+Serves /v1/poll, /v1/poll/ack/{id}, /graphql and the orderbook routes from a
+synthetic event stream, with configurable latency and error rate.
+"""
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import random
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+EVENT_TYPES = ("NAME_TOKEN_LISTED", "NAME_TOKEN_PURCHASED")
+TLDS = ("ai", "xyz", "io", "com", "tld")
+
+
+class StubDomaAPI:
+    def __init__(
+        self,
+        total_events: int,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 1,
+    ) -> None:
+        self.total_events = total_events
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.acked_id = 0
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    def _event(self, i: int) -> Dict[str, Any]:
+        rng = random.Random(i)
+        name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(3, 12)))
+        return {
+            "id": i,
+            "type": EVENT_TYPES[i % len(EVENT_TYPES)],
+            "name": f"{name}.{rng.choice(TLDS)}",
+            "uniqueId": f"bench-{i}",
+            "eventData": {"createdAt": dt.datetime.now(dt.timezone.utc).isoformat().replace("+00:00", "Z")},
+        }
+
+    @staticmethod
+    def _name_info(name: str) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "expiresAt": "2030-01-01T00:00:00Z",
+            "registrar": {"name": "Bench Registrar", "ianaId": "0"},
+            "tokens": [
+                {
+                    "tokenId": "1",
+                    "tokenAddress": "0x00000000000000000000000000000000000000b0",
+                    "ownerAddress": "eip155:1:0x00000000000000000000000000000000000000b1",
+                    "chain": {"networkId": "eip155:1"},
+                }
+            ],
+        }
+
+    @web.middleware
+    async def _chaos(self, request: web.Request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(0.5, 1.5))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "injected"}, status=503)
+        return await handler(request)
+
+    async def poll(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", "20"))
+        start = self.acked_id + 1
+        end = min(self.total_events, self.acked_id + limit)
+        events = [self._event(i) for i in range(start, end + 1)]
+        return web.json_response({
+            "events": events,
+            "lastId": events[-1]["id"] if events else self.acked_id,
+            "hasMoreEvents": end < self.total_events,
+        })
+
+    async def ack(self, request: web.Request) -> web.Response:
+        self.acked_id = max(self.acked_id, int(request.match_info["last_id"]))
+        return web.json_response({})
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        variables: Dict[str, str] = body.get("variables") or {}
+        data: Dict[str, Any] = {}
+        if "name" in variables:
+            data["name"] = self._name_info(variables["name"])
+            data["tokens"] = {"items": data["name"]["tokens"]}
+        else:
+            for key, name in variables.items():
+                info = self._name_info(name)
+                data[key] = info
+                data["t" + key[1:]] = {"items": info["tokens"]}
+        return web.json_response({"data": data})
+
+    async def currencies(self, request: web.Request) -> web.Response:
+        return web.json_response({"currencies": [{"symbol": "ETH"}, {"symbol": "USDC"}]})
+
+    async def fees(self, request: web.Request) -> web.Response:
+        return web.json_response({"marketplaceFees": [{"feeType": "DOMA", "basisPoints": 50, "recipient": "0x0"}]})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._chaos])
+        app.add_routes([
+            web.get("/v1/poll", self.poll),
+            web.post("/v1/poll/ack/{last_id}", self.ack),
+            web.post("/graphql", self.graphql),
+            web.get("/v1/orderbook/currencies/{chain}/{contract}/{orderbook}", self.currencies),
+            web.get("/v1/orderbook/fee/{orderbook}/{chain}/{contract}", self.fees),
+        ])
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sockets: List[Any] = list(site._server.sockets)  # type: ignore[union-attr]
+        self.base_url = f"http://{host}:{sockets[0].getsockname()[1]}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the stand-in Doma API")
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    async def _serve() -> None:
+        api = StubDomaAPI(args.events, latency_ms=args.latency_ms, error_rate=args.error_rate)
+        print("Stub Doma API on", await api.start(port=args.port))
+        while True:
+            await asyncio.sleep(3600)
+
+    asyncio.run(_serve())
@@ -2,11 +2,22 @@
 from __future__ import annotations
 import asyncio
 import datetime as dt
+import hashlib
+import json
+import logging
+import time
 from typing import Optional
 
-from sqlalchemy import String, Integer, DateTime, Text, select, delete
+from sqlalchemy import String, Integer, DateTime, Text, UniqueConstraint, cast, event, inspect, select, delete, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
 
 _engine = None
 _Session: Optional[async_sessionmaker[AsyncSession]] = None
@@ -22,6 +33,8 @@ class Subscription(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, index=True)
     filter_text: Mapped[str] = mapped_column(String(255))
+    # features.filters.CompiledFilter as JSON; NULL for rows saved before the filter grammar
+    filter_compiled: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc)
     )
@@ -33,10 +46,56 @@ class DeliveredAlert(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     event_id: Mapped[str] = mapped_column(String(128), unique=True, index=True)
     delivered_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), index=True, default=lambda: dt.datetime.now(dt.timezone.utc)
+    )
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (UniqueConstraint("event_id", "user_id", name="uq_outbox_event_user"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    event_id: Mapped[str] = mapped_column(String(128))
+    user_id: Mapped[int] = mapped_column(Integer)
+    text: Mapped[str] = mapped_column(Text)
+    # Poll API eventData.createdAt, for end-to-end latency
+    event_created_at: Mapped[Optional[dt.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), index=True, default=lambda: dt.datetime.now(dt.timezone.utc)
+    )
+    created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc)
     )
 
 
+class DigestItem(Base):
+    """An alert line buffered for a digest-mode user until its window closes or the buffer fills."""
+
+    __tablename__ = "digest_items"
+    __table_args__ = (UniqueConstraint("event_id", "user_id", name="uq_digest_event_user"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    event_id: Mapped[str] = mapped_column(String(128))
+    user_id: Mapped[int] = mapped_column(Integer, index=True)
+    line: Mapped[str] = mapped_column(Text)
+    event_created_at: Mapped[Optional[dt.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # created_at + the subscription's window; the user's digest is due at the earliest flush_at
+    flush_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), index=True)
+    max_count: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc)
+    )
+
+
+class NameInfoCacheEntry(Base):
+    __tablename__ = "name_info_cache"
+
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    payload: Mapped[str] = mapped_column(Text)
+    fetched_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
 class Setting(Base):
     __tablename__ = "settings"
 
@@ -53,15 +112,113 @@ class IdempotencyKey(Base):
     )
 
 
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def sqlite_pragmas() -> list[str]:
+    """PRAGMA statements for the configured SQLite profile (applied on every new connection)."""
+    pragmas = []
+    journal = settings.sqlite_journal_mode.upper()
+    if journal in _JOURNAL_MODES:
+        pragmas.append(f"PRAGMA journal_mode={journal}")
+    elif journal:
+        logger.warning("Ignoring unknown SQLITE_JOURNAL_MODE=%s", journal)
+    sync = settings.sqlite_synchronous.upper()
+    if sync in _SYNCHRONOUS:
+        pragmas.append(f"PRAGMA synchronous={sync}")
+    elif sync:
+        logger.warning("Ignoring unknown SQLITE_SYNCHRONOUS=%s", sync)
+    pragmas.append(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    pragmas.append(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    pragmas.append(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    return pragmas
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cur = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cur.execute(pragma)
+    finally:
+        cur.close()
+
+
+def _add_missing_columns(sync_conn) -> None:
+    """create_all never alters existing tables; add nullable columns introduced since."""
+    insp = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing or not col.nullable:
+                continue
+            ddl = col.type.compile(dialect=sync_conn.dialect)
+            sync_conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}")
+            logger.info("Added column %s.%s", table.name, col.name)
+
+
+_SCHEMA_VERSION_KEY = "schema_version"
+
+
+def schema_version() -> str:
+    """Fingerprint of the declared tables, columns and indexes; changes whenever the models do."""
+    h = hashlib.sha1()
+    for table in Base.metadata.sorted_tables:
+        h.update(table.name.encode())
+        for col in table.columns:
+            h.update(f"|{col.name}:{col.type}:{col.nullable}:{col.primary_key}".encode())
+        for idx in sorted(table.indexes, key=lambda i: i.name or ""):
+            h.update(f"|{idx.name}:{','.join(c.name for c in idx.columns)}:{idx.unique}".encode())
+        for con in sorted(table.constraints, key=lambda c: str(c.name)):
+            if isinstance(con, UniqueConstraint):
+                h.update(f"|{con.name}:{','.join(c.name for c in con.columns)}".encode())
+    return h.hexdigest()[:16]
+
+
+def _stored_schema_version(sync_conn) -> Optional[str]:
+    try:
+        return sync_conn.execute(select(Setting.value).where(Setting.key == _SCHEMA_VERSION_KEY)).scalar()
+    except OperationalError:
+        # fresh database: no settings table yet
+        return None
+
+
 async def init_db(database_url: str) -> None:
     global _engine, _Session
     url = database_url
     if url.startswith("sqlite:///"):
         url = url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
-    _engine = create_async_engine(url, echo=False, future=True)
+    if _engine is not None:
+        await _engine.dispose()
+    if url.startswith("sqlite+aiosqlite:///") and ":memory:" not in url:
+        # aiosqlite defaults to NullPool (a new connection + PRAGMAs per session); WAL lets
+        # readers (bot handlers) run alongside the poller's writer, so keep a pool sized for them
+        _engine = create_async_engine(
+            url,
+            echo=False,
+            future=True,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=max(1, settings.sqlite_pool_size),
+            max_overflow=max(0, settings.sqlite_pool_overflow),
+        )
+        event.listen(_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    else:
+        _engine = create_async_engine(url, echo=False, future=True)
     _Session = async_sessionmaker(bind=_engine, expire_on_commit=False)
+    version = schema_version()
     async with _engine.begin() as conn:
+        # create_all and the column/index checks introspect every table; skip them when nothing changed
+        if await conn.run_sync(_stored_schema_version) == version:
+            logger.debug("Schema %s up to date", version)
+            return
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        # create_all skips indexes of tables that already exist; retention pruning needs this one
+        for idx in DeliveredAlert.__table__.indexes:
+            await conn.run_sync(lambda sync_conn, idx=idx: idx.create(sync_conn, checkfirst=True))
+        stmt = sqlite_insert(Setting).values(key=_SCHEMA_VERSION_KEY, value=version)
+        await conn.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": version}))
+        logger.info("Schema updated to %s", version)
 
 
 def get_session_factory() -> async_sessionmaker[AsyncSession]:
@@ -70,10 +227,10 @@ def get_session_factory() -> async_sessionmaker[AsyncSession]:
 
 
 # Convenience helpers used by services
-async def add_subscription(user_id: int, filter_text: str) -> int:
+async def add_subscription(user_id: int, filter_text: str, filter_compiled: Optional[str] = None) -> int:
     session_factory = get_session_factory()
     async with session_factory() as s:
-        sub = Subscription(user_id=user_id, filter_text=filter_text)
+        sub = Subscription(user_id=user_id, filter_text=filter_text, filter_compiled=filter_compiled)
         s.add(sub)
         await s.commit()
         await s.refresh(sub)
@@ -107,3 +264,118 @@ async def list_all_subscriptions() -> list[Subscription]:
     async with session_factory() as s:
         res = await s.execute(select(Subscription))
         return list(res.scalars().all())
+
+
+async def load_name_info_entries(names: list[str]) -> list[NameInfoCacheEntry]:
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        res = await s.execute(select(NameInfoCacheEntry).where(NameInfoCacheEntry.name.in_(names)))
+        return list(res.scalars().all())
+
+
+async def save_name_info_entries(rows: list[dict], prune_before: Optional[dt.datetime] = None) -> None:
+    """Upsert (name, payload, fetched_at) rows in one transaction, optionally pruning expired ones."""
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        if rows:
+            stmt = sqlite_insert(NameInfoCacheEntry)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"payload": stmt.excluded.payload, "fetched_at": stmt.excluded.fetched_at},
+            )
+            await s.execute(stmt, rows)
+        if prune_before is not None:
+            await s.execute(delete(NameInfoCacheEntry).where(NameInfoCacheEntry.fetched_at < prune_before))
+        await s.commit()
+
+
+async def get_setting(key: str) -> Optional[str]:
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        row = await s.get(Setting, key)
+        return row.value if row is not None else None
+
+
+async def claim_setting(key: str, value: str) -> str:
+    """Store ``value`` unless ``key`` is already set; returns whichever value is stored."""
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        stmt = sqlite_insert(Setting).values(key=key, value=value)
+        await s.execute(stmt.on_conflict_do_nothing(index_elements=["key"]))
+        await s.commit()
+        row = await s.get(Setting, key)
+        return row.value if row is not None else value
+
+
+async def set_setting(key: str, value: str) -> None:
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        stmt = sqlite_insert(Setting).values(key=key, value=value)
+        await s.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": value}))
+        await s.commit()
+
+
+async def bump_setting(key: str) -> str:
+    """Increment an integer-valued setting (creating it at 1), e.g. a change counter other replicas poll.
+
+    Returns the new value.
+    """
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        stmt = sqlite_insert(Setting).values(key=key, value="1")
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"], set_={"value": cast(cast(Setting.value, Integer) + 1, Text)}
+        )
+        res = await s.execute(stmt.returning(Setting.value))
+        value = res.scalar_one()
+        await s.commit()
+        return value
+
+
+# Leases are settings rows holding {"owner": ..., "expires": unix time}; taking one over is a
+# compare-and-set on the previous value, so two processes can never both win the same row.
+async def try_lease(key: str, owner: str, ttl: float) -> bool:
+    """Acquire or renew ``key`` for ``owner`` unless another owner holds an unexpired lease."""
+    now = time.time()
+    value = json.dumps({"owner": owner, "expires": now + ttl})
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        row = await s.get(Setting, key)
+        if row is None:
+            res = await s.execute(
+                sqlite_insert(Setting).values(key=key, value=value).on_conflict_do_nothing(index_elements=["key"])
+            )
+        else:
+            holder, expires = _parse_lease(row.value)
+            if holder != owner and expires > now:
+                return False
+            res = await s.execute(
+                update(Setting).where(Setting.key == key, Setting.value == row.value).values(value=value)
+            )
+        await s.commit()
+        return res.rowcount == 1
+
+
+async def release_lease(key: str, owner: str) -> None:
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        row = await s.get(Setting, key)
+        if row is not None and _parse_lease(row.value)[0] == owner:
+            await s.execute(delete(Setting).where(Setting.key == key, Setting.value == row.value))
+            await s.commit()
+
+
+async def list_leases(prefix: str) -> dict[str, tuple[str, float]]:
+    """key -> (owner, expires) for every lease row whose key starts with ``prefix``."""
+    session_factory = get_session_factory()
+    async with session_factory() as s:
+        res = await s.execute(select(Setting).where(Setting.key.startswith(prefix)))
+        return {row.key: _parse_lease(row.value) for row in res.scalars().all()}
+
+
+def _parse_lease(value: str) -> tuple[str, float]:
+    try:
+        obj = json.loads(value)
+        return str(obj["owner"]), float(obj["expires"])
+    except (ValueError, KeyError, TypeError):
+        return "", 0.0
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import httpx
+
+from infra.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of calling an endpoint family whose breaker is open."""
+
+    def __init__(self, family: str, retry_in: float) -> None:
+        super().__init__(f"circuit open for {family} (retry in {retry_in:.1f}s)")
+        self.family = family
+        self.retry_in = retry_in
+
+
+class RetryBudget:
+    """Allow at most ``max_retries`` retries per sliding ``window`` seconds."""
+
+    def __init__(self, max_retries: int, window: float) -> None:
+        self.max_retries = max(0, max_retries)
+        self.window = max(0.001, window)
+        self._spent: Deque[float] = deque()
+        self.exhausted_total = 0
+
+    def _trim(self, now: float) -> None:
+        while self._spent and now - self._spent[0] > self.window:
+            self._spent.popleft()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._spent) >= self.max_retries:
+            self.exhausted_total += 1
+            return False
+        self._spent.append(now)
+        return True
+
+    @property
+    def remaining(self) -> int:
+        self._trim(time.monotonic())
+        return max(0, self.max_retries - len(self._spent))
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        family: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        half_open_probes: Optional[int] = None,
+        retry_budget: Optional[RetryBudget] = None,
+    ) -> None:
+        self.family = family
+        self.failure_threshold = max(1, failure_threshold or settings.doma_breaker_failures)
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.doma_breaker_reset_seconds
+        self.half_open_probes = max(1, half_open_probes or settings.doma_breaker_half_open_probes)
+        self.budget = (
+            retry_budget if retry_budget is not None
+            else RetryBudget(settings.doma_retry_budget, settings.doma_retry_budget_window)
+        )
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        # bumped on every move to HALF_OPEN, so a late release from an earlier round is ignored
+        self._probe_round = 0
+        # metrics
+        self.calls_total = 0
+        self.failures_total = 0
+        self.short_circuited_total = 0
+        self.opened_total = 0
+        self.retries_total = 0
+        self.latency_ewma = 0.0
+        self.last_latency = 0.0
+
+    def before_call(self) -> Optional[int]:
+        """Admit a call or raise CircuitOpenError.
+
+        Returns a probe token when the call is a HALF_OPEN probe; pass it to
+        ``release_probe`` once the call ends, however it ends.
+        """
+        if self.state == OPEN:
+            waited = time.monotonic() - self._opened_at
+            if waited < self.reset_timeout:
+                self.short_circuited_total += 1
+                raise CircuitOpenError(self.family, self.reset_timeout - waited)
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_round += 1
+        token: Optional[int] = None
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.short_circuited_total += 1
+                raise CircuitOpenError(self.family, 0.0)
+            self._probes_in_flight += 1
+            token = self._probe_round
+        self.calls_total += 1
+        return token
+
+    def release_probe(self, token: Optional[int]) -> None:
+        if token is not None and token == self._probe_round and self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _observe(self, latency: float) -> None:
+        self.last_latency = latency
+        self.latency_ewma = latency if not self.latency_ewma else 0.2 * latency + 0.8 * self.latency_ewma
+
+    def record_success(self, latency: float) -> None:
+        self._observe(latency)
+        self._consecutive_failures = 0
+        self.state = CLOSED
+
+    def record_failure(self, latency: float) -> None:
+        self._observe(latency)
+        self.failures_total += 1
+        self._consecutive_failures += 1
+        if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened_total += 1
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probes_in_flight = 0
+
+    def allow_retry(self) -> bool:
+        if self.state == OPEN or not self.budget.take():
+            return False
+        self.retries_total += 1
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "calls": self.calls_total,
+            "failures": self.failures_total,
+            "short_circuited": self.short_circuited_total,
+            "opened": self.opened_total,
+            "retries": self.retries_total,
+            "retry_budget_left": self.budget.remaining,
+            "latency_ms": round(self.latency_ewma * 1000, 1),
+        }
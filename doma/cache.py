@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from data.models import load_name_info_entries, save_name_info_entries
+from doma.client import DomaClient
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NameInfoCache:
+    """Shared LRU cache around DomaClient.get_name_info / get_names_info.
+
+    - hits live for ``ttl`` seconds, empty results (no data or upstream error) for ``negative_ttl``
+    - a positive entry past its TTL but within ``stale_seconds`` is served while a
+      background refresh runs; if that refresh fails the entry is kept and the refresh
+      retried after ``negative_ttl``
+    - concurrent misses for the same name share one upstream request
+    - with ``persist`` enabled, misses are first looked up in the ``name_info_cache``
+      table and fresh upstream results are written behind in batches, so a restarted
+      process warm-starts from the previous one's entries
+    """
+
+    def __init__(
+        self,
+        client: DomaClient,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = None,
+        stale_seconds: Optional[float] = None,
+        persist: Optional[bool] = None,
+    ) -> None:
+        self.client = client
+        self.max_size = max(1, max_size or settings.name_cache_size)
+        self.ttl = ttl if ttl is not None else settings.name_cache_ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else settings.name_cache_negative_ttl
+        self.stale_seconds = stale_seconds if stale_seconds is not None else settings.name_cache_stale_seconds
+        # name -> (fetched_at monotonic, info)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Set[asyncio.Task] = set()
+        # name -> monotonic time before which a failed refresh is not retried
+        self._retry_at: Dict[str, float] = {}
+        self.persist = settings.name_cache_persist if persist is None else persist
+        self.flush_seconds = max(0.1, settings.name_cache_flush_seconds)
+        self.flush_batch = max(1, settings.name_cache_flush_batch)
+        # name -> (fetched_at wall clock, info) waiting to be written behind
+        self._dirty: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # stats
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+        }
+
+    def _lookup(self, name: str, now: float) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Returns (info, needs_refresh); info is None on a miss."""
+        ent = self._entries.get(name)
+        if ent is None:
+            return None, False
+        age = now - ent[0]
+        info = ent[1]
+        if not info:
+            if age < self.negative_ttl:
+                self._entries.move_to_end(name)
+                return info, False
+            return None, False
+        if age < self.ttl:
+            self._entries.move_to_end(name)
+            return info, False
+        if age < self.ttl + self.stale_seconds:
+            self._entries.move_to_end(name)
+            return info, True
+        return None, False
+
+    def _store(self, name: str, info: Dict[str, Any], fetched_at: Optional[float] = None) -> None:
+        self._entries[name] = (fetched_at if fetched_at is not None else time.monotonic(), info or {})
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            self._retry_at.pop(evicted, None)
+            self.evictions += 1
+
+    async def _fetch_many(self, names: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Set[str]]:
+        """Returns (name -> info, names whose request failed)."""
+        size = max(1, settings.enrich_batch_size)
+        sem = asyncio.Semaphore(max(1, settings.enrich_concurrency))
+        failed: Set[str] = set()
+
+        async def fetch(chunk: List[str]) -> Dict[str, Dict[str, Any]]:
+            async with sem:
+                try:
+                    if len(chunk) == 1:
+                        return {chunk[0]: await self.client.get_name_info(chunk[0], raise_errors=True)}
+                    return await self.client.get_names_info(chunk, raise_errors=True)
+                except Exception:
+                    logger.exception("Name info fetch failed for %d names", len(chunk))
+                    failed.update(chunk)
+                    return {}
+
+        out: Dict[str, Dict[str, Any]] = {}
+        chunks = [names[i:i + size] for i in range(0, len(names), size)]
+        for res in await asyncio.gather(*(fetch(c) for c in chunks)):
+            out.update(res)
+        return out, failed
+
+    async def _read_disk(self, names: List[str]) -> Dict[str, Tuple[float, Dict[str, Any]]]:
+        """Return name -> (fetched_at monotonic, info) for persisted entries still usable."""
+        try:
+            rows = await load_name_info_entries(names)
+        except Exception:
+            logger.exception("Name cache disk read failed")
+            return {}
+        now_wall = time.time()
+        now_mono = time.monotonic()
+        out: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        for row in rows:
+            fetched = row.fetched_at
+            if fetched.tzinfo is None:
+                fetched = fetched.replace(tzinfo=dt.timezone.utc)
+            age = max(0.0, now_wall - fetched.timestamp())
+            if age >= self.ttl + self.stale_seconds:
+                continue
+            try:
+                info = json.loads(row.payload)
+            except ValueError:
+                continue
+            if info:
+                out[row.name] = (now_mono - age, info)
+        return out
+
+    async def _load(self, names: List[str], use_disk: bool = True) -> None:
+        """Fetch names (disk first, then upstream), resolving the in-flight futures registered for them."""
+        res: Optional[Dict[str, Dict[str, Any]]] = None
+        failed: Set[str] = set()
+        from_disk: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        try:
+            if use_disk and self.persist:
+                from_disk = await self._read_disk(names)
+                self.disk_hits += len(from_disk)
+            upstream = [n for n in names if n not in from_disk]
+            res, failed = await self._fetch_many(upstream) if upstream else ({}, set())
+        finally:
+            now = time.monotonic()
+            stale: List[str] = []
+            for name in names:
+                if name in from_disk:
+                    fetched_at, info = from_disk[name]
+                    self._store(name, info, fetched_at)
+                    if now - fetched_at >= self.ttl:
+                        stale.append(name)
+                elif name in failed and self._usable(name, now):
+                    # upstream error: keep serving the previous entry, retry later
+                    info = self._entries[name][1]
+                    self._retry_at[name] = now + self.negative_ttl
+                else:
+                    info = (res or {}).get(name) or {}
+                    # a cancelled fetch releases waiters but caches nothing
+                    if res is not None:
+                        self._store(name, info)
+                        self._retry_at.pop(name, None)
+                        if info:
+                            self._mark_dirty(name, info)
+                fut = self._inflight.pop(name, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(info)
+            if stale and res is not None:
+                self._refresh_in_background(stale)
+
+    def _usable(self, name: str, now: float) -> bool:
+        """A positive entry still inside its stale window."""
+        ent = self._entries.get(name)
+        return ent is not None and bool(ent[1]) and now - ent[0] < self.ttl + self.stale_seconds
+
+    # ---------- write-behind ----------
+    def _mark_dirty(self, name: str, info: Dict[str, Any]) -> None:
+        if not self.persist:
+            return
+        self._dirty[name] = (time.time(), info)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        deadline = time.monotonic() + self.flush_seconds
+        while self._dirty and len(self._dirty) < self.flush_batch and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.5, self.flush_seconds))
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write pending entries to the name_info_cache table in one transaction."""
+        if not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        rows = [
+            {
+                "name": name,
+                "payload": json.dumps(info, separators=(",", ":")),
+                "fetched_at": dt.datetime.fromtimestamp(ts, dt.timezone.utc),
+            }
+            for name, (ts, info) in pending.items()
+        ]
+        horizon = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=self.ttl + self.stale_seconds)
+        try:
+            await save_name_info_entries(rows, prune_before=horizon)
+            self.disk_writes += len(rows)
+        except Exception:
+            logger.exception("Name cache write-behind failed for %d entries", len(rows))
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        if self.persist:
+            await self.flush()
+
+    def _refresh_in_background(self, names: Iterable[str]) -> None:
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        todo = []
+        for name in names:
+            if name in self._inflight or self._retry_at.get(name, 0.0) > now:
+                continue
+            self._inflight[name] = loop.create_future()
+            todo.append(name)
+        if not todo:
+            return
+        self.refreshes += len(todo)
+        task = asyncio.create_task(self._load(todo, use_disk=False))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def get(self, name: str) -> Dict[str, Any]:
+        return (await self.get_many([name])).get(name) or {}
+
+    async def get_many(self, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        out: Dict[str, Dict[str, Any]] = {}
+        stale: List[str] = []
+        waiting: Dict[str, asyncio.Future] = {}
+        to_fetch: List[str] = []
+        for name in dict.fromkeys(n for n in names if n):
+            info, needs_refresh = self._lookup(name, now)
+            if info is not None:
+                out[name] = info
+                if needs_refresh:
+                    self.stale_hits += 1
+                    stale.append(name)
+                else:
+                    self.hits += 1
+                continue
+            self.misses += 1
+            fut = self._inflight.get(name)
+            if fut is not None:
+                self.coalesced += 1
+            else:
+                fut = loop.create_future()
+                self._inflight[name] = fut
+                to_fetch.append(name)
+            waiting[name] = fut
+        if stale:
+            self._refresh_in_background(stale)
+        if to_fetch:
+            await self._load(to_fetch)
+        for name, fut in waiting.items():
+            out[name] = await asyncio.shield(fut)
+        return out
@@ -1,18 +1,72 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import asyncio
+import datetime as dt
+import gzip
+import json
+import logging
 import random
+import time
 from typing import Any, Dict, List, Optional
 import httpx
 import backoff
 
+from doma.breaker import CircuitBreaker
 from infra.config import settings
+from infra.metrics import HTTP_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+_shared: Optional["DomaClient"] = None
+
+
+def get_doma_client() -> "DomaClient":
+    """Process-wide DomaClient (one connection pool for poller, CTA and bot handlers)."""
+    global _shared
+    if _shared is None:
+        _shared = DomaClient()
+    return _shared
+
+
+def _is_transient(exc: httpx.HTTPError) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code == 429 or code >= 500
+    return True
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
 
 
 class DomaClient:
-    def __init__(self, base_url: Optional[str] = None, timeout: float = 10.0) -> None:
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = None) -> None:
         self.base_url = (base_url or settings.doma_base_url).rstrip("/")
-        self._client = httpx.AsyncClient(timeout=timeout)
+        self.max_connections = max(1, settings.doma_http_max_connections)
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=max(0, settings.doma_http_max_keepalive),
+            keepalive_expiry=settings.doma_http_keepalive_expiry,
+        )
+        if timeout is not None:
+            timeouts = httpx.Timeout(timeout)
+        else:
+            timeouts = httpx.Timeout(
+                connect=settings.doma_http_connect_timeout,
+                read=settings.doma_http_read_timeout,
+                write=settings.doma_http_write_timeout,
+                pool=settings.doma_http_pool_timeout,
+            )
+        http2 = settings.doma_http2
+        if http2 and not _http2_available():
+            logger.warning("DOMA_HTTP2=true but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+        self._client = httpx.AsyncClient(timeout=timeouts, limits=limits, http2=http2)
         self._headers = {}
         if settings.doma_api_key:
             # Support either Authorization: Bearer ... or x-api-key: ... via env DOMA_API_HEADER
@@ -20,24 +74,99 @@ class DomaClient:
                 self._headers["Authorization"] = f"Bearer {settings.doma_api_key}"
             else:
                 self._headers[settings.doma_api_header] = settings.doma_api_key
-
+        # pool metrics
+        self.in_flight = 0
+        self.pool_waits = 0
+        self.requests_total = 0
+        # one breaker per endpoint family: poll, ack, graphql, orderbook
+        self.max_tries = max(1, settings.doma_retry_max_tries)
+        self.breakers: Dict[str, CircuitBreaker] = {}
 
     async def close(self) -> None:
+        global _shared
         await self._client.aclose()
+        if _shared is self:
+            _shared = None
 
-    # Backoff-enabled HTTP helpers (used when not simulating)
-    @backoff.on_exception(backoff.expo, httpx.HTTPError, max_tries=3)
-    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
-        r = await self._client.get(url, params=params, headers=self._headers or None)
-        r.raise_for_status()
-        return r
+    def pool_stats(self) -> Dict[str, int]:
+        stats = {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "pool_waits": self.pool_waits,
+            "requests_total": self.requests_total,
+        }
+        # httpcore internals are best-effort; absent on other transports
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        conns = getattr(pool, "connections", None)
+        if conns is not None:
+            stats["connections"] = len(conns)
+            stats["idle"] = sum(1 for c in conns if c.is_idle())
+        reqs = getattr(pool, "_requests", None)
+        if reqs is not None:
+            stats["queued"] = sum(1 for r in reqs if r.is_queued())
+        return stats
 
-    @backoff.on_exception(backoff.expo, httpx.HTTPError, max_tries=3)
-    async def _post(self, url: str, json: Optional[Dict[str, Any]] = None) -> httpx.Response:
-        r = await self._client.post(url, json=json, headers=self._headers or None)
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        self.requests_total += 1
+        if self.in_flight >= self.max_connections:
+            self.pool_waits += 1
+        self.in_flight += 1
+        try:
+            r = await self._client.request(method, url, headers=self._headers or None, **kwargs)
+        finally:
+            self.in_flight -= 1
         r.raise_for_status()
         return r
 
+    def breaker(self, family: str) -> CircuitBreaker:
+        br = self.breakers.get(family)
+        if br is None:
+            br = self.breakers[family] = CircuitBreaker(family)
+        return br
+
+    def breaker_stats(self) -> Dict[str, Dict[str, object]]:
+        return {family: br.stats() for family, br in self.breakers.items()}
+
+    async def _request(self, family: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send through the family's circuit breaker, retrying transient errors within its retry budget."""
+        br = self.breaker(family)
+        delays = backoff.expo()
+        delays.send(None)  # prime the generator, as backoff's own decorators do
+        attempt = 0
+        while True:
+            probe = br.before_call()
+            start = time.perf_counter()
+            try:
+                try:
+                    r = await self._send(method, url, **kwargs)
+                finally:
+                    # cancelled or failed in any way: the HALF_OPEN slot must not leak
+                    br.release_probe(probe)
+            except httpx.HTTPError as e:
+                latency = time.perf_counter() - start
+                HTTP_REQUEST_SECONDS.labels(family, "error").observe(latency)
+                if not _is_transient(e):
+                    # the endpoint answered; a 4xx is not an outage
+                    br.record_success(latency)
+                    raise
+                br.record_failure(latency)
+                attempt += 1
+                if attempt >= self.max_tries or not br.allow_retry():
+                    raise
+                await asyncio.sleep(backoff.full_jitter(next(delays)))
+                continue
+            latency = time.perf_counter() - start
+            HTTP_REQUEST_SECONDS.labels(family, "ok").observe(latency)
+            br.record_success(latency)
+            return r
+
+    # Breaker- and retry-aware HTTP helpers (used when not simulating)
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None, family: str = "default") -> httpx.Response:
+        return await self._request(family, "GET", url, params=params)
+
+    async def _post(self, url: str, json: Optional[Dict[str, Any]] = None, family: str = "default") -> httpx.Response:
+        return await self._request(family, "POST", url, json=json)
+
     async def get_events(self, kind: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Fetch recent events from Doma Poll API or simulate.
 
@@ -51,7 +180,7 @@ class DomaClient:
                     "type": "NAME_TOKEN_LISTED",
                     "name": f"demo{i}.tld",
                     "uniqueId": f"sim-{kind}-{i}-{random.randint(1000,9999)}",
-                    "eventData": {"createdAt": "2025-09-04T00:00:00Z"},
+                    "eventData": {"createdAt": dt.datetime.now(dt.timezone.utc).isoformat().replace("+00:00", "Z")},
                 }
                 for i in range(1, min(limit, 3) + 1)
             ]
@@ -65,13 +194,26 @@ class DomaClient:
             params.setdefault("eventTypes", []).append(t)
         params["finalizedOnly"] = settings.doma_finalized_only
         try:
-            r = await self._get(url, params=params)
+            r = await self._get(url, params=params, family="poll")
             data = r.json() or {}
             events = data.get("events", [])
             # Return list of events as-is; caller will use fields: id, uniqueId, name, type, eventData
-            return events if isinstance(events, list) else []
+            events = events if isinstance(events, list) else []
         except httpx.HTTPError:
             return []
+        if events and settings.doma_record_file:
+            self._record(events)
+        return events
+
+    def _record(self, events: List[Dict[str, Any]]) -> None:
+        """Append events as JSONL for replay.py; recording must never break polling."""
+        path = settings.doma_record_file
+        try:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "at", encoding="utf-8") as f:
+                f.writelines(json.dumps(ev, separators=(",", ":")) + "\n" for ev in events)
+        except OSError as e:
+            logger.warning("Cannot record events to %s: %s", path, e)
 
 
     async def ack_events(self, last_event_id: int) -> bool:
@@ -79,7 +221,7 @@ class DomaClient:
             return True
         url = f"{self.base_url}/v1/poll/ack/{last_event_id}"
         try:
-            r = await self._post(url, json=None)
+            r = await self._post(url, json=None, family="ack")
             return r.status_code == 200
         except httpx.HTTPError:
             return False
@@ -89,7 +231,7 @@ class DomaClient:
             return {"domain": domain, "state": "simulated"}
         url = f"{self.base_url}/domains/{domain}"
         try:
-            r = await self._get(url)
+            r = await self._get(url, family="domains")
             return r.json()
         except httpx.HTTPError:
             return {"domain": domain, "state": "error"}
@@ -100,55 +242,103 @@ class DomaClient:
         url = f"{self.base_url}/orders"
         payload = {"domain": domain, "price": price}
         try:
-            r = await self._post(url, json=payload)
+            r = await self._post(url, json=payload, family="orderbook")
             return r.json()
         except httpx.HTTPError as e:
             return {"ok": False, "error": str(e)}
 
     # ---------- Subgraph (GraphQL) and Orderbook helpers ----------
-    async def get_name_info(self, name: str) -> Dict[str, Any]:
-        """Fetch basic name info (expiresAt, registrar, tokens) from Subgraph GraphQL."""
+    _NAME_FIELDS = "name expiresAt registrar { name ianaId } tokens { tokenId tokenAddress ownerAddress chain { networkId } }"
+    _TOKEN_FIELDS = "items { tokenId tokenAddress ownerAddress chain { networkId } }"
+
+    @staticmethod
+    def _simulated_name_info(name: str) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "expiresAt": "2025-12-31T00:00:00Z",
+            "tokens": [
+                {
+                    "tokenId": "sim-token",
+                    "tokenAddress": "0x0000000000000000000000000000000000000000",
+                    "ownerAddress": "eip155:11155111:0x0000000000000000000000000000000000000000",
+                    "chain": {"networkId": "eip155:11155111"},
+                }
+            ],
+        }
+
+    @staticmethod
+    def _name_info_from(name: str, name_obj: Any, tokens_obj: Any) -> Dict[str, Any]:
+        if name_obj:
+            return name_obj
+        # Fallback: synthesize from tokens list if name() is null
+        items = ((tokens_obj or {}).get("items") or [])
+        if items:
+            return {"name": name, "expiresAt": None, "tokens": items}
+        return {}
+
+    async def get_name_info(self, name: str, raise_errors: bool = False) -> Dict[str, Any]:
+        """Fetch basic name info (expiresAt, registrar, tokens) from Subgraph GraphQL.
+
+        Transport errors return {} unless ``raise_errors`` is set.
+        """
         if settings.doma_simulate:
-            return {
-                "name": name,
-                "expiresAt": "2025-12-31T00:00:00Z",
-                "tokens": [
-                    {
-                        "tokenId": "sim-token",
-                        "tokenAddress": "0x0000000000000000000000000000000000000000",
-                        "ownerAddress": "eip155:11155111:0x0000000000000000000000000000000000000000",
-                        "chain": {"networkId": "eip155:11155111"},
-                    }
-                ],
-            }
+            return self._simulated_name_info(name)
         url = f"{self.base_url}/graphql"
         query = (
             "query($name: String!) {"
-            "  name(name: $name) { name expiresAt registrar { name ianaId } tokens { tokenId tokenAddress ownerAddress chain { networkId } } }"
-            "  tokens(name: $name, take: 1) { items { tokenId tokenAddress ownerAddress chain { networkId } } }"
+            f"  name(name: $name) {{ {self._NAME_FIELDS} }}"
+            f"  tokens(name: $name, take: 1) {{ {self._TOKEN_FIELDS} }}"
             "}"
         )
         try:
-            r = await self._post(url, json={"query": query, "variables": {"name": name}})
+            r = await self._post(url, json={"query": query, "variables": {"name": name}}, family="graphql")
             data = r.json() or {}
             d = (data.get("data", {}) or {})
-            name_obj = d.get("name") or {}
-            if name_obj:
-                return name_obj
-            # Fallback: synthesize from tokens list if name() is null
-            items = ((d.get("tokens") or {}).get("items") or [])
-            if items:
-                return {"name": name, "expiresAt": None, "tokens": items}
-            return {}
+            return self._name_info_from(name, d.get("name"), d.get("tokens"))
         except httpx.HTTPError:
+            if raise_errors:
+                raise
+            return {}
+
+    async def get_names_info(self, names: List[str], raise_errors: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Fetch name info for many names in one GraphQL POST using field aliases.
+
+        Names with no data map to {}. On transport errors the whole batch maps to {},
+        or the error is raised with ``raise_errors``.
+        """
+        names = list(dict.fromkeys(n for n in names if n))
+        if not names:
             return {}
+        if settings.doma_simulate:
+            return {n: self._simulated_name_info(n) for n in names}
+        url = f"{self.base_url}/graphql"
+        params = ", ".join(f"$n{i}: String!" for i in range(len(names)))
+        fields = " ".join(
+            f"n{i}: name(name: $n{i}) {{ {self._NAME_FIELDS} }}"
+            f" t{i}: tokens(name: $n{i}, take: 1) {{ {self._TOKEN_FIELDS} }}"
+            for i in range(len(names))
+        )
+        query = f"query({params}) {{ {fields} }}"
+        variables = {f"n{i}": n for i, n in enumerate(names)}
+        try:
+            r = await self._post(url, json={"query": query, "variables": variables}, family="graphql")
+            data = r.json() or {}
+            d = (data.get("data", {}) or {})
+            return {
+                n: self._name_info_from(n, d.get(f"n{i}"), d.get(f"t{i}"))
+                for i, n in enumerate(names)
+            }
+        except httpx.HTTPError:
+            if raise_errors:
+                raise
+            return {n: {} for n in names}
 
     async def get_supported_currencies(self, chain_id: str, contract_address: str, orderbook: str = "DOMA") -> List[Any]:
         if settings.doma_simulate:
             return [{"symbol": "ETH"}, {"symbol": "USDC"}]
         url = f"{self.base_url}/v1/orderbook/currencies/{chain_id}/{contract_address}/{orderbook}"
         try:
-            r = await self._get(url)
+            r = await self._get(url, family="orderbook")
             data = r.json() or {}
             return data.get("currencies", [])
         except httpx.HTTPError:
@@ -159,7 +349,7 @@ class DomaClient:
             return [["DOMA_FEE", "0.5%"]]
         url = f"{self.base_url}/v1/orderbook/fee/{orderbook}/{chain_id}/{contract_address}"
         try:
-            r = await self._get(url)
+            r = await self._get(url, family="orderbook")
             data = r.json() or {}
             return data.get("marketplaceFees", [])
         except httpx.HTTPError:
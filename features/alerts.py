@@ -1,22 +1,41 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from typing import Iterable
+from typing import Iterable, Optional
 from sqlalchemy import select
 from data.models import DeliveredAlert, get_session_factory
+from features.dedupe import DedupeFront
 
 
 class AlertsService:
-    async def was_delivered(self, event_id: str) -> bool:
-        session_factory = get_session_factory()
-        async with session_factory() as s:
-            res = await s.execute(select(DeliveredAlert).where(DeliveredAlert.event_id == event_id))
-            return res.scalar_one_or_none() is not None
+    def __init__(self, front: Optional[DedupeFront] = None) -> None:
+        self.front = front if front is not None else DedupeFront()
 
     async def mark_delivered(self, event_id: str) -> None:
         session_factory = get_session_factory()
         async with session_factory() as s:
             s.add(DeliveredAlert(event_id=event_id))
             await s.commit()
+        self.front.remember([event_id])
+
+    def remember_delivered(self, event_ids: Iterable[str]) -> None:
+        """Record ids committed elsewhere (e.g. with the outbox) in the in-memory front."""
+        self.front.remember(event_ids)
+
+    async def filter_delivered(self, event_ids: Iterable[str]) -> set[str]:
+        """Return the subset of event_ids already delivered.
+
+        The in-memory front answers most ids; the rest go to SQLite in a single IN query.
+        """
+        known, candidates = self.front.split(dict.fromkeys(event_ids))
+        if not candidates:
+            return known
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(select(DeliveredAlert.event_id).where(DeliveredAlert.event_id.in_(candidates)))
+            found = set(res.scalars().all())
+        self.front.db_positives += len(found)
+        self.front.remember(found)
+        return known | found
 
     def format_alert(self, title: str, lines: Iterable[str]) -> str:
         body = "\n".join(lines)
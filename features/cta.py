@@ -1,18 +1,26 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from typing import Optional
+import asyncio
+import time
+from typing import Any, List, Optional, Tuple
 
-from doma.client import DomaClient
+from doma.cache import NameInfoCache
+from doma.client import DomaClient, get_doma_client
 from infra.config import settings
 
 
 class CTAService:
-    def __init__(self) -> None:
-        self._client: Optional[DomaClient] = None
+    def __init__(self, name_cache: Optional[NameInfoCache] = None, client: Optional[DomaClient] = None) -> None:
+        self._client: Optional[DomaClient] = client
+        self._name_cache = name_cache
+        # (chainId, contract, orderbook) -> (fetched_at, currencies, fees)
+        self._market_cache: dict[Tuple[str, str, str], Tuple[float, List[Any], List[Any]]] = {}
+        self._market_ttl = settings.cta_market_cache_ttl
+        self._market_max = 1024
 
     async def ensure_client(self) -> DomaClient:
         if self._client is None:
-            self._client = DomaClient()
+            self._client = get_doma_client()
         return self._client
 
     async def build_cta_link(self, domain: str) -> str:
@@ -34,6 +42,25 @@ class CTAService:
         }
 
 
+    async def get_market(self, chain_id: str, contract_address: str, orderbook: str) -> Tuple[List[Any], List[Any]]:
+        """Supported currencies and orderbook fees for a token, fetched concurrently and TTL-cached."""
+        key = (chain_id, contract_address, orderbook)
+        now = time.monotonic()
+        ent = self._market_cache.get(key)
+        if ent and now - ent[0] < self._market_ttl:
+            return ent[1], ent[2]
+        client = await self.ensure_client()
+        currencies, fees = await asyncio.gather(
+            client.get_supported_currencies(chain_id, contract_address, orderbook),
+            client.get_orderbook_fees(orderbook, chain_id, contract_address),
+        )
+        # both endpoints return [] on errors; don't pin a failure for the whole TTL
+        if currencies or fees:
+            if len(self._market_cache) >= self._market_max:
+                self._market_cache.pop(next(iter(self._market_cache)))
+            self._market_cache[key] = (now, currencies, fees)
+        return currencies, fees
+
     async def order_preview(
         self,
         domain: str,
@@ -45,7 +72,10 @@ class CTAService:
         Returns: { ok, domain, price, chainId, tokenAddress, currencies, selectedCurrency, fees, cta }
         """
         client = await self.ensure_client()
-        info = await client.get_name_info(domain)
+        if self._name_cache is not None:
+            info = await self._name_cache.get(domain)
+        else:
+            info = await client.get_name_info(domain)
         if not info:
             # Fallback: still return CTA so demo flow doesn't block
             return {
@@ -75,8 +105,7 @@ class CTAService:
         token = tokens[0]
         chain_id = (token.get("chain") or {}).get("networkId") or ""
         contract_address = token.get("tokenAddress") or ""
-        currencies = await client.get_supported_currencies(chain_id, contract_address, orderbook)
-        fees = await client.get_orderbook_fees(orderbook, chain_id, contract_address)
+        currencies, fees = await self.get_market(chain_id, contract_address, orderbook)
         selected = None
         if currency_symbol and currencies:
             sym = currency_symbol.upper()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+
+from data.models import DeliveredAlert, get_session_factory
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        capacity = max(1, capacity)
+        error_rate = min(0.5, max(1e-9, error_rate))
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class DedupeFront:
+    """In-process front for delivered_alerts lookups.
+
+    A bounded LRU answers recently seen ids; a Bloom filter built from the table
+    answers "definitely not delivered". Only possible matches reach SQLite.
+    Until ``warm()`` finishes every id is checked in SQLite.
+    """
+
+    def __init__(
+        self,
+        lru_size: Optional[int] = None,
+        bloom_capacity: Optional[int] = None,
+        bloom_error_rate: Optional[float] = None,
+    ) -> None:
+        self.lru_size = max(1, lru_size or settings.dedupe_lru_size)
+        self.bloom_capacity = max(1, bloom_capacity or settings.dedupe_bloom_capacity)
+        self.bloom_error_rate = bloom_error_rate or settings.dedupe_bloom_error_rate
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._bloom: Optional[BloomFilter] = None
+        # stats
+        self.lru_hits = 0
+        self.bloom_negatives = 0
+        self.db_checks = 0
+        self.db_positives = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "lru": len(self._recent),
+            "bloom_items": self._bloom.count if self._bloom else 0,
+            "lru_hits": self.lru_hits,
+            "bloom_negatives": self.bloom_negatives,
+            "db_checks": self.db_checks,
+            "db_positives": self.db_positives,
+        }
+
+    async def warm(self) -> None:
+        """(Re)build the Bloom filter by streaming every event_id from delivered_alerts."""
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(select(func.count()).select_from(DeliveredAlert))
+            rows = int(res.scalar_one())
+            bloom = BloomFilter(max(self.bloom_capacity, rows * 2), self.bloom_error_rate)
+            stream = await s.stream_scalars(select(DeliveredAlert.event_id).execution_options(yield_per=5000))
+            async for event_id in stream:
+                bloom.add(event_id)
+        # ids remembered while streaming are in the LRU; fold them in too
+        for event_id in self._recent:
+            bloom.add(event_id)
+        self._bloom = bloom
+        logger.info("Dedupe front warmed: %d ids, bloom %d bits x %d hashes", bloom.count, bloom.size, bloom.hashes)
+
+    def invalidate(self) -> None:
+        """Check every id in SQLite until the next ``warm()``, e.g. after ids were marked by another process."""
+        self._bloom = None
+
+    def remember(self, event_ids: Iterable[str]) -> None:
+        for event_id in event_ids:
+            self._recent[event_id] = None
+            self._recent.move_to_end(event_id)
+            if self._bloom is not None:
+                self._bloom.add(event_id)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+        if self._bloom is not None and self._bloom.count > self._bloom_limit():
+            # saturated: fall back to SQLite until the next warm()
+            self._bloom = None
+
+    def _bloom_limit(self) -> int:
+        return max(self.bloom_capacity, 1) * 4
+
+    def split(self, event_ids: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+        """Returns (known delivered, candidates that need a SQLite check)."""
+        known: Set[str] = set()
+        candidates: Set[str] = set()
+        for event_id in event_ids:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                self.lru_hits += 1
+                known.add(event_id)
+            elif self._bloom is not None and event_id not in self._bloom:
+                self.bloom_negatives += 1
+            else:
+                candidates.add(event_id)
+        self.db_checks += len(candidates)
+        return known, candidates
+
+
+class DeliveredRetention:
+    """Prunes delivered_alerts older than the retention window in bounded batches."""
+
+    def __init__(self, front: Optional[DedupeFront] = None) -> None:
+        self.front = front
+        self.retention_days = settings.delivered_retention_days
+        self.batch_size = max(1, settings.retention_batch_size)
+        self.interval = max(1.0, settings.retention_interval_seconds)
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+        # metrics
+        self.pruned_total = 0
+        self.last_run_pruned = 0
+
+    async def start(self) -> None:
+        if self.retention_days <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._stopped.clear()
+            self._task = asyncio.create_task(self._run(), name="delivered_retention")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            await self._task
+
+    async def prune_once(self) -> int:
+        cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=self.retention_days)
+        session_factory = get_session_factory()
+        pruned = 0
+        while not self._stopped.is_set():
+            async with session_factory() as s:
+                ids = select(DeliveredAlert.id).where(DeliveredAlert.delivered_at < cutoff).limit(self.batch_size)
+                res = await s.execute(delete(DeliveredAlert).where(DeliveredAlert.id.in_(ids)))
+                await s.commit()
+            deleted = res.rowcount or 0
+            pruned += deleted
+            if deleted < self.batch_size:
+                break
+            # yield between batches so writers are not starved
+            await asyncio.sleep(0.05)
+        # freed pages stay in the file and are reused by new marks, so no vacuum is needed
+        if pruned and self.front is not None:
+            await self.front.warm()
+        self.last_run_pruned = pruned
+        self.pruned_total += pruned
+        return pruned
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                pruned = await self.prune_once()
+                if pruned:
+                    logger.info("Pruned %d delivered_alerts older than %d days", pruned, self.retention_days)
+            except Exception as e:
+                logger.exception("Retention error: %s", e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = max(0.001, rate)
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+@dataclass
+class DeliveryJob:
+    chat_id: int
+    text: str
+    attempts: int = 0
+    # opaque caller reference (e.g. outbox row id)
+    key: Any = None
+    # seconds from now after which a postponed job should be retried
+    retry_in: float = 0.0
+
+
+@dataclass
+class DeliveryReport:
+    delivered: int = 0
+    failed: int = 0
+    throttled: int = 0
+    deferred: int = 0
+    elapsed: float = 0.0
+    sent: List[DeliveryJob] = field(default_factory=list)
+    dropped: List[DeliveryJob] = field(default_factory=list)
+    postponed: List[DeliveryJob] = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        return self.delivered / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class DeliveryEngine:
+    """Concurrent Telegram fan-out with a global token bucket and per-chat pacing.
+
+    A job whose chat is still cooling down (pacing or a 429 retry_after) is put back
+    on the queue after the remaining delay instead of holding a worker. Delays longer
+    than ``max_hold`` are handed back to the caller in ``report.postponed``; jobs for
+    the same chat get consecutive pacing slots in ``retry_in``.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: Optional[int] = None,
+        global_rate: Optional[float] = None,
+        per_chat_interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+    ) -> None:
+        self.bot = bot
+        self.concurrency = max(1, concurrency or settings.send_concurrency)
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else settings.tg_per_chat_interval
+        self.max_attempts = max(1, max_attempts or settings.send_max_attempts)
+        self.bucket = TokenBucket(global_rate or settings.tg_global_rate)
+        self._chat_ready: Dict[int, float] = {}
+        # metrics
+        self.delivered_total = 0
+        self.failed_total = 0
+        self.throttled_total = 0
+        self.deferred_total = 0
+
+    async def deliver(
+        self,
+        jobs: Iterable[Union[DeliveryJob, Tuple[int, str]]],
+        max_hold: float = math.inf,
+    ) -> DeliveryReport:
+        queue: asyncio.Queue[DeliveryJob] = asyncio.Queue()
+        for job in jobs:
+            if not isinstance(job, DeliveryJob):
+                job = DeliveryJob(chat_id=job[0], text=job[1])
+            queue.put_nowait(job)
+        report = DeliveryReport()
+        outstanding = queue.qsize()
+        if not outstanding:
+            return report
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
+        timers: list[asyncio.TimerHandle] = []
+        postponed_per_chat: Dict[int, int] = {}
+
+        def settle() -> None:
+            nonlocal outstanding
+            outstanding -= 1
+            if outstanding == 0:
+                finished.set()
+
+        def requeue(job: DeliveryJob, delay: float) -> None:
+            delay = max(0.0, delay)
+            if delay > max_hold:
+                slot = postponed_per_chat.get(job.chat_id, 0)
+                postponed_per_chat[job.chat_id] = slot + 1
+                job.retry_in = delay + slot * self.per_chat_interval
+                report.postponed.append(job)
+                settle()
+                return
+            timers.append(loop.call_later(delay, queue.put_nowait, job))
+
+        async def worker() -> None:
+            while True:
+                job = await queue.get()
+                now = time.monotonic()
+                ready_at = self._chat_ready.get(job.chat_id, 0.0)
+                if ready_at > now:
+                    report.deferred += 1
+                    requeue(job, ready_at - now)
+                    continue
+                self._chat_ready[job.chat_id] = now + self.per_chat_interval
+                await self.bucket.acquire()
+                job.attempts += 1
+                try:
+                    await self.bot.send_message(chat_id=job.chat_id, text=job.text)
+                    report.delivered += 1
+                    report.sent.append(job)
+                    settle()
+                    continue
+                except TelegramRetryAfter as e:
+                    report.throttled += 1
+                    self._chat_ready[job.chat_id] = time.monotonic() + e.retry_after
+                    if job.attempts < self.max_attempts:
+                        requeue(job, e.retry_after)
+                        continue
+                    logger.warning("Giving up on user_id=%s after %d throttled attempts", job.chat_id, job.attempts)
+                except (TelegramNetworkError, TelegramServerError):
+                    if job.attempts < self.max_attempts:
+                        requeue(job, 2 ** job.attempts)
+                        continue
+                    logger.exception("Failed to send to user_id=%s", job.chat_id)
+                except Exception:
+                    logger.exception("Failed to send to user_id=%s", job.chat_id)
+                report.failed += 1
+                report.dropped.append(job)
+                settle()
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, outstanding))]
+        try:
+            await finished.wait()
+        finally:
+            for t in timers:
+                t.cancel()
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        report.elapsed = time.perf_counter() - start
+        self.delivered_total += report.delivered
+        self.failed_total += report.failed
+        self.throttled_total += report.throttled
+        self.deferred_total += report.deferred
+        self._prune_chat_ready()
+        return report
+
+    def _prune_chat_ready(self) -> None:
+        now = time.monotonic()
+        if len(self._chat_ready) > 10_000:
+            self._chat_ready = {k: v for k, v in self._chat_ready.items() if v > now}
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Subscription filter grammar and the shared indexes used to match it.
+
+    type:LISTED tld:ai len<=5 score>=3 name~crypto
+
+Terms on different fields must all hold. Several values for one field (repeated terms or
+comma lists such as ``type:LISTED,PURCHASED``) are alternatives. Bare words are event types,
+so legacy filters like ``LISTED PURCHASED`` keep their meaning.
+
+``digest:10m`` / ``digest:20`` / ``digest:10m,20`` / ``digest:on`` is not a predicate: it
+asks for matching alerts to be batched into one message per window (s/m/h) or count.
+"""
+from __future__ import annotations
+import json
+import re
+from bisect import bisect_left, bisect_right
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class FilterSyntaxError(ValueError):
+    pass
+
+
+_BOUND = re.compile(r"^(len|score)(<=|>=|<|>|=)(-?\d+)$")
+_WORD = re.compile(r"^[A-Za-z0-9_,]+$")
+_DURATION = re.compile(r"^(\d+)(s|m|h)$")
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+@dataclass(frozen=True)
+class CompiledFilter:
+    types: Tuple[str, ...] = ()
+    tlds: Tuple[str, ...] = ()
+    keywords: Tuple[str, ...] = ()
+    len_min: Optional[int] = None
+    len_max: Optional[int] = None
+    score_min: Optional[int] = None
+    score_max: Optional[int] = None
+    # digest delivery; None window/count means the DIGEST_* defaults
+    digest: bool = False
+    digest_window: Optional[int] = None
+    digest_count: Optional[int] = None
+
+    def to_json(self) -> str:
+        data = {
+            k: list(v) if isinstance(v, tuple) else v
+            for k, v in asdict(self).items()
+            if v is not None and v is not False and v != ()
+        }
+        return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CompiledFilter":
+        data = json.loads(raw)
+        return cls(
+            types=tuple(data.get("types", ())),
+            tlds=tuple(data.get("tlds", ())),
+            keywords=tuple(data.get("keywords", ())),
+            len_min=data.get("len_min"),
+            len_max=data.get("len_max"),
+            score_min=data.get("score_min"),
+            score_max=data.get("score_max"),
+            digest=bool(data.get("digest", False)),
+            digest_window=data.get("digest_window"),
+            digest_count=data.get("digest_count"),
+        )
+
+
+def _split_values(value: str) -> List[str]:
+    return [v for v in value.split(",") if v]
+
+
+def _apply_bound(bounds: Dict[str, Optional[int]], field: str, op: str, n: int) -> None:
+    lo, hi = bounds[f"{field}_min"], bounds[f"{field}_max"]
+    if op in (">=", ">", "="):
+        n_lo = n + 1 if op == ">" else n
+        lo = n_lo if lo is None else max(lo, n_lo)
+    if op in ("<=", "<", "="):
+        n_hi = n - 1 if op == "<" else n
+        hi = n_hi if hi is None else min(hi, n_hi)
+    if lo is not None and hi is not None and lo > hi:
+        raise FilterSyntaxError(f"{field} range is empty")
+    bounds[f"{field}_min"], bounds[f"{field}_max"] = lo, hi
+
+
+def _parse_digest(values: List[str], digest: Dict[str, Optional[int]]) -> None:
+    for value in values:
+        value = value.lower()
+        m = _DURATION.match(value)
+        if value == "on":
+            continue
+        elif m:
+            digest["digest_window"] = int(m.group(1)) * _UNITS[m.group(2)]
+        elif value.isdigit():
+            digest["digest_count"] = int(value)
+        else:
+            raise FilterSyntaxError(f"bad digest value '{value}', expected e.g. digest:10m or digest:20")
+    if digest["digest_window"] == 0 or digest["digest_count"] == 0:
+        raise FilterSyntaxError("digest window and count must be positive")
+
+
+def parse_filter(text: str) -> CompiledFilter:
+    """Parse a filter string; raises FilterSyntaxError with a user-facing message."""
+    types: List[str] = []
+    tlds: List[str] = []
+    keywords: List[str] = []
+    bounds: Dict[str, Optional[int]] = {"len_min": None, "len_max": None, "score_min": None, "score_max": None}
+    digest: Dict[str, Optional[int]] = {"digest_window": None, "digest_count": None}
+    is_digest = False
+    for raw in (text or "").split():
+        m = _BOUND.match(raw.lower())
+        if m:
+            _apply_bound(bounds, m.group(1), m.group(2), int(m.group(3)))
+        elif "~" in raw:
+            field, _, value = raw.partition("~")
+            if field.lower() != "name" or not value:
+                raise FilterSyntaxError(f"bad term '{raw}', expected name~<keyword>")
+            keywords.extend(v.lower() for v in _split_values(value))
+        elif ":" in raw:
+            field, _, value = raw.partition(":")
+            values = _split_values(value)
+            if not values:
+                raise FilterSyntaxError(f"missing value in '{raw}'")
+            field = field.lower()
+            if field == "type":
+                types.extend(v.upper() for v in values)
+            elif field == "tld":
+                tlds.extend(v.lower().lstrip(".") for v in values)
+            elif field == "digest":
+                _parse_digest(values, digest)
+                is_digest = True
+            else:
+                raise FilterSyntaxError(f"unknown field '{field}'")
+        elif _WORD.match(raw):
+            types.extend(v.upper() for v in _split_values(raw))
+        else:
+            raise FilterSyntaxError(f"bad term '{raw}'")
+    return CompiledFilter(
+        types=tuple(dict.fromkeys(types)),
+        tlds=tuple(dict.fromkeys(t for t in tlds if t)),
+        keywords=tuple(dict.fromkeys(keywords)),
+        digest=is_digest,
+        **bounds,
+        **digest,
+    )
+
+
+def compile_stored(filter_text: str, compiled: Optional[str]) -> CompiledFilter:
+    """Compiled form of a stored subscription; rows saved before the grammar fall back to type words."""
+    if compiled:
+        return CompiledFilter.from_json(compiled)
+    try:
+        return parse_filter(filter_text)
+    except FilterSyntaxError:
+        return CompiledFilter(types=tuple(dict.fromkeys(w.upper() for w in re.findall(r"[A-Za-z0-9_]+", filter_text or ""))))
+
+
+def split_domain(domain: str) -> Tuple[str, str]:
+    """Returns (name label, tld) lowercased, using the same label as heuristic_score."""
+    domain = (domain or "").lower()
+    tld = domain.rsplit(".", 1)[1] if "." in domain else ""
+    return domain.split(".")[0], tld
+
+
+# Slot sets are Python ints used as bitsets: union/intersection over tens of thousands
+# of subscriptions is a handful of machine-word operations.
+_BYTE_BITS = tuple(tuple(i for i in range(8) if b >> i & 1) for b in range(256))
+_NONZERO_RUN = re.compile(rb"[^\x00]+")
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for run in _NONZERO_RUN.finditer(data):
+        for offset in range(run.start(), run.end()):
+            base = offset * 8
+            for bit in _BYTE_BITS[data[offset]]:
+                yield base + bit
+
+
+class KeyBuckets:
+    """key -> slot mask, plus the slots that accept any key."""
+
+    def __init__(self) -> None:
+        self.any = 0
+        self._by_key: Dict[str, int] = {}
+
+    def add(self, bit: int, keys: Iterable[str]) -> None:
+        keys = tuple(keys)
+        if not keys:
+            self.any |= bit
+        for key in keys:
+            self._by_key[key] = self._by_key.get(key, 0) | bit
+
+    def remove(self, bit: int, keys: Iterable[str]) -> None:
+        keys = tuple(keys)
+        if not keys:
+            self.any &= ~bit
+        for key in keys:
+            mask = self._by_key.get(key, 0) & ~bit
+            if mask:
+                self._by_key[key] = mask
+            else:
+                self._by_key.pop(key, None)
+
+    def lookup(self, *keys: str) -> int:
+        mask = self.any
+        for key in keys:
+            mask |= self._by_key.get(key, 0)
+        return mask
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton; each pattern's mask is OR-ed into the search result."""
+
+    def __init__(self, patterns: Dict[str, int]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[int] = [0]
+        for pattern, mask in patterns.items():
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append(0)
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] |= mask
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def search(self, text: str) -> int:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            found |= out[state]
+        return found
+
+
+class KeywordBuckets(KeyBuckets):
+    """Keyword -> slot mask, matched by substring through a lazily rebuilt Aho-Corasick automaton."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._automaton: Optional[AhoCorasick] = None
+
+    def add(self, bit: int, keys: Iterable[str]) -> None:
+        super().add(bit, keys)
+        self._automaton = None
+
+    def remove(self, bit: int, keys: Iterable[str]) -> None:
+        super().remove(bit, keys)
+        self._automaton = None
+
+    def search(self, text: str) -> int:
+        if not self._by_key:
+            return self.any
+        if self._automaton is None:
+            self._automaton = AhoCorasick(self._by_key)
+        return self.any | self._automaton.search(text)
+
+
+class Thresholds:
+    """Slots bounded by ``value >= t`` (lower) or ``value <= t`` (upper).
+
+    Distinct thresholds are kept sorted with cumulative masks, so a lookup is one bisect.
+    """
+
+    def __init__(self, lower: bool) -> None:
+        self.lower = lower
+        self.any = 0
+        self._by_value: Dict[int, int] = {}
+        self._sorted: Optional[Tuple[List[int], List[int]]] = None
+
+    def add(self, bit: int, bound: Optional[int]) -> None:
+        if bound is None:
+            self.any |= bit
+            return
+        self._by_value[bound] = self._by_value.get(bound, 0) | bit
+        self._sorted = None
+
+    def remove(self, bit: int, bound: Optional[int]) -> None:
+        if bound is None:
+            self.any &= ~bit
+            return
+        mask = self._by_value.get(bound, 0) & ~bit
+        if mask:
+            self._by_value[bound] = mask
+        else:
+            self._by_value.pop(bound, None)
+        self._sorted = None
+
+    def _build(self) -> Tuple[List[int], List[int]]:
+        values = sorted(self._by_value)
+        cumulative = [0] * (len(values) + 1)
+        if self.lower:
+            # cumulative[i] = slots with threshold among values[:i]
+            for i, v in enumerate(values):
+                cumulative[i + 1] = cumulative[i] | self._by_value[v]
+        else:
+            # cumulative[i] = slots with threshold among values[i:]
+            for i in range(len(values) - 1, -1, -1):
+                cumulative[i] = cumulative[i + 1] | self._by_value[values[i]]
+        return values, cumulative
+
+    def lookup(self, value: int) -> int:
+        if self._sorted is None:
+            self._sorted = self._build()
+        values, cumulative = self._sorted
+        if self.lower:
+            return self.any | cumulative[bisect_right(values, value)]
+        return self.any | cumulative[bisect_left(values, value)]
+
+
+class FilterMatcher:
+    """Evaluates many compiled filters at once; filters live in integer slots."""
+
+    def __init__(self) -> None:
+        self.types = KeyBuckets()
+        self.tlds = KeyBuckets()
+        self.keywords = KeywordBuckets()
+        self.len_min = Thresholds(lower=True)
+        self.len_max = Thresholds(lower=False)
+        self.score_min = Thresholds(lower=True)
+        self.score_max = Thresholds(lower=False)
+
+    def add(self, slot: int, flt: CompiledFilter) -> None:
+        bit = 1 << slot
+        self.types.add(bit, flt.types)
+        self.tlds.add(bit, flt.tlds)
+        self.keywords.add(bit, flt.keywords)
+        self.len_min.add(bit, flt.len_min)
+        self.len_max.add(bit, flt.len_max)
+        self.score_min.add(bit, flt.score_min)
+        self.score_max.add(bit, flt.score_max)
+
+    def remove(self, slot: int, flt: CompiledFilter) -> None:
+        bit = 1 << slot
+        self.types.remove(bit, flt.types)
+        self.tlds.remove(bit, flt.tlds)
+        self.keywords.remove(bit, flt.keywords)
+        self.len_min.remove(bit, flt.len_min)
+        self.len_max.remove(bit, flt.len_max)
+        self.score_min.remove(bit, flt.score_min)
+        self.score_max.remove(bit, flt.score_max)
+
+    def match(self, ev_types: Iterable[str], name: str, tld: str, score: int) -> int:
+        """Mask of slots whose filter accepts the event; cheapest fields first, stopping at zero."""
+        mask = self.types.lookup(*ev_types)
+        if mask:
+            mask &= self.tlds.lookup(tld)
+        if mask:
+            mask &= self.len_min.lookup(len(name)) & self.len_max.lookup(len(name))
+        if mask:
+            mask &= self.score_min.lookup(score) & self.score_max.lookup(score)
+        if mask:
+            mask &= self.keywords.search(name)
+        return mask
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from data.models import claim_setting, list_leases, set_setting
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".jsonl"
+_CURSOR = "cursor.json"
+_ID_FILE = "journal.id"
+# settings row naming the journal directory every replica must share
+_ID_KEY = "journal_id"
+
+
+def _decode(line: bytes) -> Tuple[Dict[str, Any], Optional[float]]:
+    """One journal line: ``{"fetched_at": ..., "event": {...}}``, or a bare event from older journals."""
+    obj = json.loads(line)
+    if isinstance(obj, dict) and isinstance(obj.get("event"), dict) and "fetched_at" in obj:
+        return obj["event"], obj["fetched_at"]
+    return obj, None
+
+
+class JournalPosition(NamedTuple):
+    segment: int
+    offset: int
+
+
+class EventJournal:
+    """Append-only, segmented on-disk log of raw Poll API events.
+
+    Each page is written as JSONL lines and fsynced once, so the poller can ack as soon
+    as ``append`` returns. A consumer reads from a persisted cursor; segments wholly
+    behind the cursor are deleted on ``commit``. File I/O runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_bytes: Optional[int] = None,
+        fsync: Optional[bool] = None,
+    ) -> None:
+        self.directory = directory or settings.journal_dir
+        self.segment_bytes = max(4096, segment_bytes or settings.journal_segment_bytes)
+        self.fsync = settings.journal_fsync if fsync is None else fsync
+        self.cursor = JournalPosition(0, 0)
+        # end of the last durable append; readers never go past it
+        self._end = JournalPosition(0, 0)
+        self._sizes: Dict[int, int] = {}
+        # _sizes changes in to_thread workers while the loop reads it for backlog_bytes
+        self._sizes_lock = threading.Lock()
+        self._file = None
+        # metrics
+        self.appended_total = 0
+        self.consumed_total = 0
+        self.rotations = 0
+        self.deleted_segments = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:016d}{_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        out = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX) and name[: -len(_SUFFIX)].isdigit():
+                out.append(int(name[: -len(_SUFFIX)]))
+        return sorted(out)
+
+    def open(self) -> None:
+        """Recover state from disk: drop a torn tail, load the cursor, open the last segment."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments() or [0]
+        # reopened on every leadership change; another leader may have moved the files meanwhile
+        sizes = {}
+        for seg in segments:
+            path = self._path(seg)
+            sizes[seg] = os.path.getsize(path) if os.path.exists(path) else 0
+        with self._sizes_lock:
+            self._sizes = sizes
+        active = segments[-1]
+        self._truncate_torn_tail(active)
+        self.cursor = self._load_cursor() or JournalPosition(segments[0], 0)
+        if self.cursor.segment < segments[0] or self.cursor.segment > active:
+            logger.warning("Journal cursor %s outside segments %d..%d; restarting at the oldest", self.cursor, segments[0], active)
+            self.cursor = JournalPosition(segments[0], 0)
+        self._file = open(self._path(active), "ab")
+        self._end = JournalPosition(active, self._sizes[active])
+        logger.info("Journal opened: %s segments=%d cursor=%s end=%s", self.directory, len(segments), self.cursor, self._end)
+
+    def _truncate_torn_tail(self, segment: int) -> None:
+        path = self._path(segment)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            good = data.rfind(b"\n") + 1
+            if good < len(data):
+                logger.warning("Journal segment %d: truncating %d bytes of a torn write", segment, len(data) - good)
+                f.truncate(good)
+                with self._sizes_lock:
+                    self._sizes[segment] = good
+
+    def _load_cursor(self) -> Optional[JournalPosition]:
+        try:
+            with open(os.path.join(self.directory, _CURSOR), encoding="utf-8") as f:
+                data = json.load(f)
+            return JournalPosition(int(data["segment"]), int(data["offset"]))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Unreadable journal cursor (%s); restarting at the oldest segment", e)
+            return None
+
+    def identity(self) -> str:
+        """Random id of this journal directory, created on first use."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, _ID_FILE)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            with open(path, encoding="ascii") as f:
+                return f.read().strip()
+        ident = uuid.uuid4().hex
+        with os.fdopen(fd, "w", encoding="ascii") as f:
+            f.write(ident)
+            f.flush()
+            os.fsync(f.fileno())
+        return ident
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def head(self) -> JournalPosition:
+        """End of the last durable append."""
+        return self._end
+
+    def backlog_bytes(self) -> int:
+        cursor = self.cursor
+        with self._sizes_lock:
+            sizes = list(self._sizes.items())
+        return max(0, sum(size for seg, size in sizes if seg >= cursor.segment) - cursor.offset)
+
+    def stats(self) -> dict:
+        with self._sizes_lock:
+            segments = len(self._sizes)
+        return {
+            "segments": segments,
+            "backlog_bytes": self.backlog_bytes(),
+            "appended": self.appended_total,
+            "consumed": self.consumed_total,
+            "rotations": self.rotations,
+            "cursor": f"{self.cursor.segment}:{self.cursor.offset}",
+        }
+
+    # writer side
+
+    def _rotate(self) -> None:
+        self.close()
+        segment = self._end.segment + 1
+        self._file = open(self._path(segment), "ab")
+        with self._sizes_lock:
+            self._sizes[segment] = 0
+        self._end = JournalPosition(segment, 0)
+        self.rotations += 1
+
+    def _append_sync(self, data: bytes) -> JournalPosition:
+        assert self._file is not None, "journal not opened"
+        if self._end.offset >= self.segment_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        end = JournalPosition(self._end.segment, self._end.offset + len(data))
+        with self._sizes_lock:
+            self._sizes[end.segment] = end.offset
+        self._end = end
+        return end
+
+    async def append(self, events: List[Dict[str, Any]], fetched_at: Optional[float] = None) -> JournalPosition:
+        """Durably append one page fetched at ``fetched_at``; one write and one fsync per call."""
+        if not events:
+            return self._end
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        data = b"".join(
+            json.dumps({"fetched_at": fetched_at, "event": ev}, separators=(",", ":")).encode() + b"\n"
+            for ev in events
+        )
+        end = await asyncio.to_thread(self._append_sync, data)
+        self.appended_total += len(events)
+        return end
+
+    # reader side
+
+    def _read_sync(
+        self, start: JournalPosition, end: JournalPosition, limit: int
+    ) -> Tuple[List[Dict[str, Any]], JournalPosition, Optional[float]]:
+        events: List[Dict[str, Any]] = []
+        fetched_at: Optional[float] = None
+        pos = start
+        page_end = False
+        while len(events) < limit and pos.segment <= end.segment and not page_end:
+            stop = end.offset if pos.segment == end.segment else None
+            try:
+                with open(self._path(pos.segment), "rb") as f:
+                    f.seek(pos.offset)
+                    while len(events) < limit and (stop is None or pos.offset < stop):
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break
+                        try:
+                            event, line_fetched_at = _decode(line)
+                        except ValueError:
+                            pos = JournalPosition(pos.segment, pos.offset + len(line))
+                            logger.warning("Skipping corrupt journal entry at %s", pos)
+                            continue
+                        if events and line_fetched_at != fetched_at:
+                            # a batch never spans pages, so it carries one fetch time
+                            page_end = True
+                            break
+                        pos = JournalPosition(pos.segment, pos.offset + len(line))
+                        events.append(event)
+                        fetched_at = line_fetched_at
+            except FileNotFoundError:
+                logger.warning("Journal segment %d missing; skipping", pos.segment)
+            if page_end or len(events) >= limit or pos.segment == end.segment:
+                break
+            pos = JournalPosition(pos.segment + 1, 0)
+        return events, pos, fetched_at
+
+    async def read(
+        self, limit: int, start: Optional[JournalPosition] = None
+    ) -> Tuple[List[Dict[str, Any]], JournalPosition, Optional[float]]:
+        """Up to ``limit`` events of one page after ``start`` (default: the cursor).
+
+        Returns the events, the position just past them and the page's fetch time.
+        """
+        return await asyncio.to_thread(self._read_sync, start or self.cursor, self._end, max(1, limit))
+
+    def _commit_sync(self, pos: JournalPosition) -> None:
+        tmp = os.path.join(self.directory, _CURSOR + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": pos.segment, "offset": pos.offset}, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.directory, _CURSOR))
+        with self._sizes_lock:
+            behind = [s for s in self._sizes if s < pos.segment]
+        for seg in behind:
+            try:
+                os.remove(self._path(seg))
+            except FileNotFoundError:
+                pass
+            with self._sizes_lock:
+                self._sizes.pop(seg, None)
+            self.deleted_segments += 1
+
+    async def commit(self, pos: JournalPosition, consumed: int = 0) -> None:
+        """Persist the cursor and delete segments that are entirely behind it."""
+        await asyncio.to_thread(self._commit_sync, pos)
+        self.cursor = pos
+        self.consumed_total += consumed
+
+
+async def ensure_shared(journal: EventJournal, owner: str) -> None:
+    """Refuse to run unless ``journal`` is the directory the other live replicas use.
+
+    Pages are acked once they reach the leader's journal, so a journal only the old leader
+    could see would strand its unprocessed tail on failover. The first replica records its
+    directory id in the database. A replica that finds another id while other replicas are
+    live raises; with none live it takes over, and the old journal's tail is lost.
+    """
+    local = await asyncio.to_thread(journal.identity)
+    recorded = await claim_setting(_ID_KEY, local)
+    if recorded == local:
+        return
+    now = time.time()
+    members = await list_leases("member:")
+    others = sorted(holder for holder, expires in members.values() if holder != owner and expires > now)
+    if others:
+        raise RuntimeError(
+            f"JOURNAL_DIR {journal.directory!r} is not the journal used by {', '.join(others)}; "
+            "put JOURNAL_DIR on storage every replica shares, or set JOURNAL_DIR= to turn journaling off"
+        )
+    logger.warning(
+        "Journal %s replaces journal %s; events it acked but had not processed are lost", local, recorded
+    )
+    await set_setting(_ID_KEY, local)
+
+
+@dataclass
+class JournalBatch:
+    seq: int
+    events: List[Dict[str, Any]]
+    end: JournalPosition
+    fetched_at: Optional[float] = None
+
+
+class JournalConsumer:
+    """Pipelined journal consumer: reader -> bounded queue -> N workers -> commit stage.
+
+    The reader prefetches batches while workers process earlier ones; a full queue
+    stalls the reader. Batches may finish out of order, so the commit stage only
+    advances the cursor over a contiguous run of finished batches.
+    """
+
+    def __init__(
+        self,
+        journal: EventJournal,
+        process: Callable[[List[Dict[str, Any]], Optional[float]], Awaitable[Any]],
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        idle_seconds: Optional[float] = None,
+    ) -> None:
+        self.journal = journal
+        self.process = process
+        self.batch_size = max(1, batch_size or settings.poll_page_size)
+        self.workers = max(1, workers or settings.pipeline_workers)
+        self.queue_size = max(1, queue_size or settings.pipeline_queue_size)
+        self.idle_seconds = max(0.1, idle_seconds or settings.outbox_idle_seconds)
+        self._work: "asyncio.Queue[JournalBatch]" = asyncio.Queue(maxsize=self.queue_size)
+        self._done: "asyncio.Queue[Optional[JournalBatch]]" = asyncio.Queue()
+        # finished batches waiting for an earlier one (commit stage reorder buffer)
+        self._finished: Dict[int, JournalBatch] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stopped = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        # metrics
+        self.error_total = 0
+        self.in_flight = 0
+        self.batches_total = 0
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._work.qsize(),
+            "in_flight": self.in_flight,
+            "awaiting_commit": len(self._finished) + self._done.qsize(),
+            "batches": self.batches_total,
+            "errors": self.error_total,
+        }
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopped.clear()
+        self._tasks = [
+            asyncio.create_task(self._commit_stage(), name="journal_commit"),
+            *(asyncio.create_task(self._worker(), name=f"journal_worker_{i}") for i in range(self.workers)),
+            asyncio.create_task(self._reader(), name="journal_reader"),
+        ]
+
+    async def stop(self) -> None:
+        """Stop reading; queued batches are finished and committed before returning."""
+        if not self._tasks:
+            return
+        commit, *workers, reader = self._tasks
+        self._stopped.set()
+        # the reader may be blocked on a full queue; whatever it has not queued is re-read next start
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        # let live workers take everything queued; a worker that gave up during stop leaves
+        # its batches uncommitted, so they are replayed from the cursor on the next start
+        while (self._work.qsize() or self.in_flight) and not all(w.done() for w in workers):
+            await asyncio.sleep(0.05)
+        # the rest are idle in get(); no sentinels, since a full queue with no worker left would block
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while not self._work.empty():
+            self._work.get_nowait()
+        self._done.put_nowait(None)
+        await commit
+        self._finished.clear()
+        self._tasks = []
+
+    async def _reader(self) -> None:
+        pos = self.journal.cursor
+        seq = 0
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            events: List[Dict[str, Any]] = []
+            try:
+                events, end, fetched_at = await self.journal.read(self.batch_size, start=pos)
+                if end != pos:
+                    seq += 1
+                    # blocks while the queue is full: backpressure on reading
+                    await self._work.put(JournalBatch(seq, events, end, fetched_at))
+                    pos = end
+            except Exception as e:
+                self.error_total += 1
+                logger.exception("Journal reader error: %s", e)
+            if events and pos != self.journal.head:
+                # batches stop at page boundaries; keep reading while the journal has more
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.idle_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            batch = await self._work.get()
+            self.in_flight += 1
+            try:
+                while batch.events:
+                    try:
+                        await self.process(batch.events, batch.fetched_at)
+                        break
+                    except Exception as e:
+                        # retry in place: the cursor must not pass an unprocessed batch
+                        self.error_total += 1
+                        logger.exception("Journal batch %d failed: %s", batch.seq, e)
+                        if self._stopped.is_set():
+                            # left uncommitted; replayed from the cursor on next start
+                            return
+                        await asyncio.sleep(self.idle_seconds)
+                self.batches_total += 1
+                await self._done.put(batch)
+            finally:
+                self.in_flight -= 1
+
+    async def _commit_stage(self) -> None:
+        next_seq = 1
+        while True:
+            batch = await self._done.get()
+            closing = batch is None
+            if batch is not None:
+                self._finished[batch.seq] = batch
+            # group-commit everything that finished meanwhile
+            while not self._done.empty():
+                more = self._done.get_nowait()
+                if more is None:
+                    closing = True
+                else:
+                    self._finished[more.seq] = more
+            last: Optional[JournalBatch] = None
+            consumed = 0
+            while next_seq in self._finished:
+                last = self._finished.pop(next_seq)
+                consumed += len(last.events)
+                next_seq += 1
+            if last is not None:
+                try:
+                    await self.journal.commit(last.end, consumed)
+                except Exception as e:
+                    self.error_total += 1
+                    logger.exception("Journal commit error: %s", e)
+            if closing:
+                return
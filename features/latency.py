@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from infra.config import settings
+from infra.metrics import ALERT_LATENCY_SECONDS
+
+# chain -> poll -> match -> delivered, plus the end-to-end sum; digest messages wait out their
+# window on purpose, so they get their own leg and stay out of the end-to-end SLO
+LEGS = ("chain_to_poll", "poll_to_match", "match_to_delivered", "end_to_end", "digest_delivery")
+
+
+class RollingPercentiles:
+    """Samples over a sliding time window, bounded in count; percentiles computed on demand."""
+
+    def __init__(self, window_seconds: float, max_samples: int) -> None:
+        self.window = window_seconds
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max(1, max_samples))
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        self._samples.append((now if now is not None else time.monotonic(), value))
+
+    def _trim(self) -> None:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def __len__(self) -> int:
+        self._trim()
+        return len(self._samples)
+
+    def percentiles(self, *qs: float) -> Dict[float, Optional[float]]:
+        self._trim()
+        values = sorted(v for _, v in self._samples)
+        if not values:
+            return {q: None for q in qs}
+        last = len(values) - 1
+        return {q: values[min(last, int(round(q * last)))] for q in qs}
+
+
+class LatencyTracker:
+    def __init__(self, window_seconds: Optional[float] = None, max_samples: Optional[int] = None) -> None:
+        window = window_seconds or settings.latency_window_seconds
+        size = max_samples or settings.latency_max_samples
+        self.legs: Dict[str, RollingPercentiles] = {leg: RollingPercentiles(window, size) for leg in LEGS}
+
+    def record(self, leg: str, seconds: Optional[float]) -> None:
+        if seconds is None:
+            return
+        seconds = max(0.0, seconds)
+        self.legs[leg].add(seconds)
+        ALERT_LATENCY_SECONDS.labels(leg).observe(seconds)
+
+    def p95(self, leg: str = "end_to_end") -> Optional[float]:
+        return self.legs[leg].percentiles(0.95)[0.95]
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        out = {}
+        for leg, series in self.legs.items():
+            p = series.percentiles(0.5, 0.95, 0.99)
+            out[leg] = {"n": len(series), "p50": p[0.5], "p95": p[0.95], "p99": p[0.99]}
+        return out
+
+    def ready(self, slo_seconds: Optional[float] = None) -> Tuple[bool, Optional[float]]:
+        """(ok, p95 end-to-end); ok while there are no samples yet."""
+        slo = slo_seconds if slo_seconds is not None else settings.alert_lag_slo_seconds
+        p95 = self.p95()
+        return (p95 is None or p95 <= slo), p95
+
+
+# Process-wide tracker shared by the poller, outbox worker and health routes
+tracker = LatencyTracker()
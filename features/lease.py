@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Awaitable, Callable, FrozenSet, Optional, Set
+
+from data.models import list_leases, release_lease, try_lease
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def default_owner() -> str:
+    return settings.replica_id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaderLease:
+    """Single-leader election over a lease row in the settings table.
+
+    The holder renews every ttl/3 and only considers itself leader until ttl - ttl/3 after
+    its last successful renewal, so it steps down before another replica can take over
+    (at ttl). ``on_acquire``/``on_release`` run on every leadership change.
+    LEADER_LEASE_SECONDS=0 disables election: this process always leads.
+    """
+
+    def __init__(
+        self,
+        key: str = "leader:poller",
+        owner: Optional[str] = None,
+        ttl: Optional[float] = None,
+        on_acquire: Optional[Callable[[], Awaitable[None]]] = None,
+        on_release: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        self.key = key
+        self.owner = owner or default_owner()
+        self.ttl = settings.leader_lease_seconds if ttl is None else ttl
+        self.renew_every = max(0.1, self.ttl / 3)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self._leading = False
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+        # metrics
+        self.acquired_total = 0
+        self.lost_total = 0
+        self.error_total = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leading and (self.ttl <= 0 or time.monotonic() < self._valid_until)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "leader": self.is_leader,
+            "acquired": self.acquired_total,
+            "lost": self.lost_total,
+            "errors": self.error_total,
+        }
+
+    async def start(self) -> None:
+        if self.ttl <= 0:
+            if not self._leading:
+                await self._set_leading(True)
+            return
+        if self._task is None or self._task.done():
+            self._stopped.clear()
+            # first round inline, so the caller knows right away whether it leads or stands by
+            await self._tick_safely()
+            self._task = asyncio.create_task(self._run(), name="leader_lease")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            await self._task
+            self._task = None
+        if self._leading:
+            await self._set_leading(False)
+            if self.ttl > 0:
+                try:
+                    # hand over now instead of making the next leader wait out the ttl
+                    await release_lease(self.key, self.owner)
+                except Exception as e:
+                    logger.warning("Releasing %s failed: %s", self.key, e)
+
+    async def tick(self) -> None:
+        started = time.monotonic()
+        try:
+            held = await try_lease(self.key, self.owner, self.ttl)
+        except Exception as e:
+            # e.g. SQLITE_BUSY: keep leading until the local validity runs out, retry next tick
+            self.error_total += 1
+            logger.warning("Lease %s renewal error: %s", self.key, e)
+            if self._leading and time.monotonic() >= self._valid_until:
+                self.lost_total += 1
+                logger.warning("Lease %s expired locally; stepping down", self.key)
+                await self._set_leading(False)
+            return
+        if held:
+            self._valid_until = started + self.ttl - self.renew_every
+            if not self._leading:
+                self.acquired_total += 1
+                logger.info("Lease %s acquired by %s", self.key, self.owner)
+                await self._set_leading(True)
+        elif self._leading:
+            self.lost_total += 1
+            logger.warning("Lease %s taken over by another replica; stepping down", self.key)
+            await self._set_leading(False)
+
+    async def _set_leading(self, leading: bool) -> None:
+        self._leading = leading
+        callback = self.on_acquire if leading else self.on_release
+        if callback is not None:
+            await callback()
+
+    async def _tick_safely(self) -> None:
+        try:
+            await self.tick()
+        except Exception as e:
+            self.error_total += 1
+            logger.exception("Lease %s error: %s", self.key, e)
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.renew_every)
+            except asyncio.TimeoutError:
+                pass
+            if not self._stopped.is_set():
+                await self._tick_safely()
+
+
+class ShardLeases:
+    """Delivery shards (``abs(user_id) % total``) spread across live replicas.
+
+    Every replica heartbeats a ``member:`` row and holds up to ceil(total / live members)
+    ``shard:`` leases, taking over expired ones and releasing any surplus when a replica
+    joins. ``lock`` is held by the outbox worker from claim to settle, and a shard is only
+    released under it, so a batch in flight never changes hands.
+    """
+
+    def __init__(self, total: Optional[int] = None, owner: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        self.total = max(1, total or settings.delivery_shards)
+        self.owner = owner or default_owner()
+        self.ttl = settings.leader_lease_seconds if ttl is None else ttl
+        self.renew_every = max(0.1, self.ttl / 3)
+        self.lock = asyncio.Lock()
+        self._owned: FrozenSet[int] = frozenset(range(self.total)) if self.ttl <= 0 else frozenset()
+        self._valid_until = 0.0
+        # start scanning for free shards at a per-replica offset so replicas do not all race for shard 0
+        self._offset = zlib.crc32(self.owner.encode()) % self.total
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+        # metrics
+        self.members = 1
+        self.error_total = 0
+
+    def owned(self) -> FrozenSet[int]:
+        """Shards this replica may deliver right now (empty once the leases may have lapsed)."""
+        if self.ttl <= 0 or time.monotonic() < self._valid_until:
+            return self._owned
+        return frozenset()
+
+    def stats(self) -> dict:
+        return {"owned": ",".join(map(str, sorted(self.owned()))) or "-", "total": self.total, "members": self.members}
+
+    async def start(self) -> None:
+        if self.ttl > 0 and (self._task is None or self._task.done()):
+            self._stopped.clear()
+            self._task = asyncio.create_task(self._run(), name="shard_leases")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            await self._task
+            self._task = None
+        if self.ttl <= 0:
+            return
+        async with self.lock:
+            owned, self._owned = self._owned, frozenset()
+            try:
+                for shard in owned:
+                    await release_lease(f"shard:{shard}", self.owner)
+                await release_lease(f"member:{self.owner}", self.owner)
+            except Exception as e:
+                logger.warning("Releasing shard leases failed: %s", e)
+
+    async def tick(self) -> None:
+        started = time.monotonic()
+        now = time.time()
+        await try_lease(f"member:{self.owner}", self.owner, self.ttl)
+        members = await list_leases("member:")
+        live = sum(1 for _, expires in members.values() if expires > now)
+        self.members = max(1, live)
+        target = math.ceil(self.total / self.members)
+
+        owned: Set[int] = set()
+        for shard in sorted(self._owned):
+            if await try_lease(f"shard:{shard}", self.owner, self.ttl):
+                owned.add(shard)
+        if len(owned) < target:
+            held = await list_leases("shard:")
+            for i in range(self.total):
+                shard = (self._offset + i) % self.total
+                if len(owned) >= target:
+                    break
+                holder, expires = held.get(f"shard:{shard}", ("", 0.0))
+                if shard in owned or (holder != self.owner and expires > now):
+                    continue
+                if await try_lease(f"shard:{shard}", self.owner, self.ttl):
+                    owned.add(shard)
+        if len(owned) > target and not self.lock.locked():
+            async with self.lock:
+                for shard in sorted(owned)[target:]:
+                    await release_lease(f"shard:{shard}", self.owner)
+                    owned.discard(shard)
+        if owned != self._owned:
+            logger.info("Delivery shards for %s: %s of %d (%d replicas)", self.owner, sorted(owned), self.total, self.members)
+        self._owned = frozenset(owned)
+        self._valid_until = started + self.ttl - self.renew_every
+
+        # forget replicas that have been gone for a while
+        for key, (holder, expires) in members.items():
+            if expires < now - 10 * self.ttl:
+                await release_lease(key, holder)
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await self.tick()
+            except Exception as e:
+                # owned() goes empty on its own if renewals keep failing past the validity window
+                self.error_total += 1
+                logger.warning("Shard lease error: %s", e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.renew_every)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import logging
+import math
+import time
+from itertools import groupby
+from operator import attrgetter
+from typing import Callable, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from data.models import DeliveredAlert, DigestItem, OutboxMessage, get_session_factory
+from features.alerts import AlertsService
+from features.delivery import DeliveryEngine, DeliveryJob
+from features.latency import LatencyTracker, tracker as default_tracker
+from features.lease import ShardLeases
+from infra.config import settings
+from infra.metrics import DIGESTED_ALERTS, MESSAGES, POLL_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+def _epoch(value: Optional[dt.datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return value.timestamp()
+
+
+def _in_shards(user_id_col, shards: Optional[Tuple[FrozenSet[int], int]]):
+    """WHERE clause for rows whose user falls in ``(owned shards, total)``; None means every row."""
+    if shards is None:
+        return None
+    owned, total = shards
+    if len(owned) >= total:
+        return None
+    return (func.abs(user_id_col) % total).in_(sorted(owned))
+
+
+def _chunk_lines(items: List[DigestItem], max_chars: int) -> List[List[DigestItem]]:
+    """Split a user's buffered items so each combined message stays under max_chars."""
+    chunks: List[List[DigestItem]] = []
+    current: List[DigestItem] = []
+    size = 0
+    for item in items:
+        if current and size + len(item.line) + 1 > max_chars:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += len(item.line) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class OutboxService:
+    async def enqueue(
+        self,
+        rows: Iterable[Sequence],
+        delivered_ids: Iterable[str],
+        digest_rows: Iterable[Sequence] = (),
+    ) -> Tuple[int, Set[str]]:
+        """Mark event ids delivered and insert (event_id, user_id, text[, event_created_at]) rows in one transaction.
+
+        digest_rows are (event_id, user_id, line, event_created_at, window_seconds, max_count)
+        and are buffered in digest_items until flush_digests() folds them into one message.
+        Rows of ids that were already marked (by a concurrent batch or another replica) are
+        dropped. Returns (rows enqueued, ids newly marked).
+        """
+        rows = list(rows)
+        digest_rows = list(digest_rows)
+        ids = list(dict.fromkeys(delivered_ids))
+        if not rows and not ids and not digest_rows:
+            return 0, set()
+        now = _utcnow()
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            fresh: Set[str] = set()
+            if ids:
+                # the mark decides who enqueues: only the transaction that inserts it adds the rows
+                stmt = (
+                    sqlite_insert(DeliveredAlert)
+                    .on_conflict_do_nothing(index_elements=["event_id"])
+                    .returning(DeliveredAlert.event_id)
+                )
+                res = await s.execute(stmt, [{"event_id": i} for i in ids])
+                fresh = set(res.scalars().all())
+                if len(fresh) < len(ids):
+                    claimed = set(ids) - fresh
+                    rows = [row for row in rows if row[0] not in claimed]
+                    digest_rows = [row for row in digest_rows if row[0] not in claimed]
+            if rows:
+                stmt = sqlite_insert(OutboxMessage).on_conflict_do_nothing(index_elements=["event_id", "user_id"])
+                await s.execute(
+                    stmt,
+                    [
+                        {
+                            "event_id": row[0],
+                            "user_id": row[1],
+                            "text": row[2],
+                            "event_created_at": row[3] if len(row) > 3 else None,
+                            "attempts": 0,
+                            "next_attempt_at": now,
+                            "created_at": now,
+                        }
+                        for row in rows
+                    ],
+                )
+            if digest_rows:
+                stmt = sqlite_insert(DigestItem).on_conflict_do_nothing(index_elements=["event_id", "user_id"])
+                await s.execute(
+                    stmt,
+                    [
+                        {
+                            "event_id": event_id,
+                            "user_id": user_id,
+                            "line": line,
+                            "event_created_at": created,
+                            "flush_at": now + dt.timedelta(seconds=window),
+                            "max_count": count,
+                            "created_at": now,
+                        }
+                        for event_id, user_id, line, created, window, count in digest_rows
+                    ],
+                )
+            await s.commit()
+        return len(rows) + len(digest_rows), fresh
+
+    async def flush_digests(
+        self,
+        format_alert: Callable[..., str],
+        max_chars: int = 3500,
+        shards: Optional[Tuple[FrozenSet[int], int]] = None,
+    ) -> Tuple[int, int]:
+        """Turn due digest buffers into outbox rows. Returns (messages, items folded).
+
+        A user's buffer is due once its oldest item's window closed or it holds max_count items.
+        ``shards`` limits this to users of the given delivery shards.
+        """
+        now = _utcnow()
+        query = select(DigestItem.user_id)
+        where = _in_shards(DigestItem.user_id, shards)
+        if where is not None:
+            query = query.where(where)
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(
+                query
+                .group_by(DigestItem.user_id)
+                .having(or_(func.min(DigestItem.flush_at) <= now, func.count() >= func.min(DigestItem.max_count)))
+            )
+            users = list(res.scalars().all())
+            if not users:
+                return 0, 0
+            res = await s.execute(
+                select(DigestItem).where(DigestItem.user_id.in_(users)).order_by(DigestItem.user_id, DigestItem.id)
+            )
+            items = list(res.scalars().all())
+            messages = []
+            for user_id, group in groupby(items, key=attrgetter("user_id")):
+                chunks = _chunk_lines(list(group), max_chars)
+                for n, chunk in enumerate(chunks, 1):
+                    title = f"Digest: {len(chunk)} alert{'s' if len(chunk) != 1 else ''}"
+                    if len(chunks) > 1:
+                        title += f" ({n}/{len(chunks)})"
+                    created = [i.event_created_at for i in chunk if i.event_created_at is not None]
+                    messages.append({
+                        "event_id": f"digest:{chunk[0].id}",
+                        "user_id": user_id,
+                        "text": format_alert(title=title, lines=[i.line for i in chunk]),
+                        "event_created_at": min(created) if created else None,
+                        "attempts": 0,
+                        "next_attempt_at": now,
+                        # oldest buffered alert, so digest_delivery includes the digest wait
+                        "created_at": min(i.created_at for i in chunk),
+                    })
+            stmt = sqlite_insert(OutboxMessage).on_conflict_do_nothing(index_elements=["event_id", "user_id"])
+            await s.execute(stmt, messages)
+            await s.execute(delete(DigestItem).where(DigestItem.id.in_([i.id for i in items])))
+            await s.commit()
+        return len(messages), len(items)
+
+    async def digest_pending(self) -> int:
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(select(func.count()).select_from(DigestItem))
+            return int(res.scalar_one())
+
+    async def claim_due(self, limit: int, shards: Optional[Tuple[FrozenSet[int], int]] = None) -> List[OutboxMessage]:
+        query = select(OutboxMessage).where(OutboxMessage.next_attempt_at <= _utcnow())
+        where = _in_shards(OutboxMessage.user_id, shards)
+        if where is not None:
+            query = query.where(where)
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(
+                query
+                .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+                .limit(limit)
+            )
+            return list(res.scalars().all())
+
+    async def settle(self, done_ids: Iterable[int], retries: Iterable[Tuple[int, int, float]]) -> None:
+        """Delete finished rows and reschedule (id, attempts, delay_seconds) in one transaction."""
+        done_ids = list(done_ids)
+        retries = list(retries)
+        if not done_ids and not retries:
+            return
+        now = _utcnow()
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            if done_ids:
+                await s.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(done_ids)))
+            for row_id, attempts, delay in retries:
+                await s.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == row_id)
+                    .values(attempts=attempts, next_attempt_at=now + dt.timedelta(seconds=delay))
+                )
+            await s.commit()
+
+    async def pending(self) -> int:
+        session_factory = get_session_factory()
+        async with session_factory() as s:
+            res = await s.execute(select(func.count()).select_from(OutboxMessage))
+            return int(res.scalar_one())
+
+
+class OutboxWorker:
+    """Drains the outbox through the DeliveryEngine, independent of the poll loop."""
+
+    def __init__(
+        self,
+        engine: DeliveryEngine,
+        outbox: Optional[OutboxService] = None,
+        latency: Optional[LatencyTracker] = None,
+        alerts: Optional[AlertsService] = None,
+        shards: Optional[ShardLeases] = None,
+    ) -> None:
+        self.engine = engine
+        self.outbox = outbox if outbox is not None else OutboxService()
+        # None: this process delivers every user (single replica)
+        self.shards = shards
+        self.latency = latency if latency is not None else default_tracker
+        self.alerts = alerts if alerts is not None else AlertsService()
+        self.batch_size = max(1, settings.outbox_batch_size)
+        self.idle_seconds = max(0.1, settings.outbox_idle_seconds)
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        # seconds until the earliest row the last batch postponed is due
+        self._next_retry = math.inf
+        # metrics
+        self.error_total = 0
+        self.last_batch_delivered = 0
+        self.last_batch_throttled = 0
+        self.last_batch_rate = 0.0
+        self.digest_messages_total = 0
+        self.digest_items_total = 0
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopped.clear()
+            self._task = asyncio.create_task(self._run(), name="outbox_worker")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._task:
+            await self._task
+
+    def _shard_filter(self) -> Optional[Tuple[FrozenSet[int], int]]:
+        if self.shards is None:
+            return None
+        owned = self.shards.owned()
+        # the Telegram global rate is per bot, so each replica takes its share of it
+        self.engine.bucket.rate = max(0.001, settings.tg_global_rate * len(owned) / self.shards.total)
+        return owned, self.shards.total
+
+    async def flush_digests(self) -> int:
+        if self.shards is None:
+            return await self._flush_digests(None)
+        async with self.shards.lock:
+            shards = self._shard_filter()
+            return await self._flush_digests(shards) if shards[0] else 0
+
+    async def _flush_digests(self, shards: Optional[Tuple[FrozenSet[int], int]]) -> int:
+        messages, items = await self.outbox.flush_digests(
+            self.alerts.format_alert, max_chars=max(200, settings.digest_message_chars), shards=shards
+        )
+        if messages:
+            self.digest_messages_total += messages
+            self.digest_items_total += items
+            DIGESTED_ALERTS.inc(items)
+            logger.info("Digest: folded %d alerts into %d messages", items, messages)
+        return messages
+
+    async def drain_once(self) -> int:
+        if self.shards is None:
+            return await self._drain(None)
+        # held from claim to settle, so a shard is never handed over with a batch in flight
+        async with self.shards.lock:
+            shards = self._shard_filter()
+            return await self._drain(shards) if shards[0] else 0
+
+    async def _drain(self, shards: Optional[Tuple[FrozenSet[int], int]]) -> int:
+        rows = await self.outbox.claim_due(self.batch_size, shards=shards)
+        if not rows:
+            return 0
+        jobs = [DeliveryJob(chat_id=r.user_id, text=r.text, attempts=r.attempts, key=r.id) for r in rows]
+        # short pacing waits are absorbed in memory; longer ones go back to the table. Holding
+        # less than one per-chat interval sends a chat at most once or twice per batch, so a
+        # batch full of one chat's rows no longer takes a pacing interval per row.
+        max_hold = min(self.idle_seconds, self.engine.per_chat_interval / 2)
+        report = await self.engine.deliver(jobs, max_hold=max_hold)
+        POLL_STAGE_SECONDS.labels("send").observe(report.elapsed)
+        MESSAGES.labels("delivered").inc(report.delivered)
+        MESSAGES.labels("failed").inc(report.failed)
+        MESSAGES.labels("throttled").inc(report.throttled)
+        retries = []
+        for job in report.postponed:
+            retries.append((job.key, job.attempts, job.retry_in))
+            self._next_retry = min(self._next_retry, job.retry_in)
+        done = [j.key for j in report.sent] + [j.key for j in report.dropped]
+        if report.sent:
+            by_id = {r.id: r for r in rows}
+            now = time.time()
+            for job in report.sent:
+                row = by_id[job.key]
+                matched = _epoch(row.created_at)
+                if row.event_id.startswith("digest:"):
+                    self.latency.record("digest_delivery", now - matched if matched else None)
+                    continue
+                created = _epoch(row.event_created_at)
+                self.latency.record("match_to_delivered", now - matched if matched else None)
+                self.latency.record("end_to_end", now - created if created else None)
+        await self.outbox.settle(done, retries)
+        self.last_batch_delivered = report.delivered
+        self.last_batch_throttled = report.throttled
+        self.last_batch_rate = report.rate
+        if report.delivered or report.failed:
+            logger.info(
+                "Outbox batch: sent=%d failed=%d throttled=%d postponed=%d in %.3fs",
+                report.delivered, report.failed, report.throttled, len(report.postponed), report.elapsed,
+            )
+        return len(rows)
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            self._next_retry = math.inf
+            claimed = 0
+            try:
+                await self.flush_digests()
+                claimed = await self.drain_once()
+            except Exception as e:
+                self.error_total += 1
+                logger.exception("Outbox worker error: %s", e)
+            if claimed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(self.idle_seconds, self._next_retry))
+            except asyncio.TimeoutError:
+                pass
@@ -1,30 +1,152 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import asyncio
+import datetime as dt
 import logging
 import time
 from collections import deque
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
 from aiogram import Bot
 
 from infra.config import settings
-from doma.client import DomaClient
+from infra.metrics import (
+    JOURNAL_BACKLOG_BYTES,
+    NAME_CACHE_SIZE,
+    PIPELINE_QUEUE_DEPTH,
+    POLL_CYCLE_SECONDS,
+    POLL_CYCLES,
+    POLL_EVENTS,
+    POLL_STAGE_SECONDS,
+    RECENT_EVENTS_SIZE,
+    startup,
+)
+from doma.cache import NameInfoCache
+from doma.client import DomaClient, get_doma_client
 from features.alerts import AlertsService
-from features.scoring import heuristic_score
+from features.dedupe import DeliveredRetention
+from features.delivery import DeliveryEngine
+from features.journal import EventJournal, JournalConsumer, ensure_shared
+from features.lease import LeaderLease, ShardLeases
+from features.latency import LatencyTracker, tracker as default_tracker
+from features.outbox import OutboxService, OutboxWorker
+from features.scoring import ScoringEngine, get_scoring_engine
 from features.subscriptions import SubscriptionsService
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_ts(value: object) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return dt.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class PollScheduler:
+    """Drain while pages come back full; otherwise stretch the interval as the feed quiets down.
+
+    The quiet-feed interval aims to collect about half a page per fetch, based on an
+    exponential moving average of the observed event rate, clamped to [min, max].
+    """
+
+    def __init__(
+        self,
+        page_size: Optional[int] = None,
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        base_interval: Optional[float] = None,
+        alpha: float = 0.3,
+    ) -> None:
+        self.page_size = max(1, page_size or settings.poll_page_size)
+        self.min_interval = max(0.5, min_interval or settings.poll_min_interval_seconds)
+        self.max_interval = max(self.min_interval, max_interval or settings.poll_max_interval_seconds)
+        base = base_interval or settings.poll_interval_seconds
+        self.base_interval = min(self.max_interval, max(self.min_interval, base))
+        self.alpha = alpha
+        self.rate: Optional[float] = None  # events/sec (EWMA)
+        self.draining = False
+        self._last: Optional[float] = None
+
+    def next_delay(self, fetched: int, acked: bool = True) -> float:
+        now = time.monotonic()
+        # a drained page says nothing about arrival rate, only about processing speed
+        if self._last is not None and not self.draining:
+            sample = fetched / max(1e-3, now - self._last)
+            self.rate = sample if self.rate is None else self.alpha * sample + (1 - self.alpha) * self.rate
+        self._last = now
+        self.draining = acked and fetched >= self.page_size
+        if self.draining:
+            return 0.0
+        if self.rate is None:
+            return self.base_interval
+        if self.rate <= 0:
+            return self.max_interval
+        target = (self.page_size / 2) / self.rate
+        return min(self.max_interval, max(self.min_interval, target))
+
+
+def _last_event_id(events: list[dict]) -> Optional[int]:
+    last_id: Optional[int] = None
+    for ev in events:
+        try:
+            last_id = int(ev.get("id"))
+        except (TypeError, ValueError):
+            pass
+    return last_id
+
+
+@dataclass
+class PageResult:
+    processed: int = 0
+    sent: int = 0
+    enqueued: int = 0
+
+
 class Poller:
-    def __init__(self, bot: Bot, alerts: AlertsService, client: Optional[DomaClient] = None) -> None:
+    def __init__(
+        self,
+        bot: Bot,
+        alerts: AlertsService,
+        client: Optional[DomaClient] = None,
+        name_cache: Optional[NameInfoCache] = None,
+        latency: Optional[LatencyTracker] = None,
+        scorer: Optional[ScoringEngine] = None,
+        outbox: Optional[OutboxService] = None,
+        first_page: Optional[asyncio.Future[List[Dict[str, Any]]]] = None,
+    ) -> None:
         self.bot = bot
         self.alerts = alerts
-        self.client = client or DomaClient()
+        self.client = client if client is not None else get_doma_client()
+        self.name_cache = name_cache if name_cache is not None else NameInfoCache(self.client)
+        self.scorer = scorer if scorer is not None else get_scoring_engine()
         self.subs = SubscriptionsService(settings.database_url)
+        self.delivery = DeliveryEngine(bot)
+        self.outbox = outbox if outbox is not None else OutboxService()
+        self.latency = latency if latency is not None else default_tracker
+        # one replica polls (leader lease); every replica delivers its share of users (shard leases)
+        self.lease = LeaderLease(on_acquire=self._lead, on_release=self._unlead)
+        self.shards = ShardLeases() if self.lease.ttl > 0 else None
+        self.outbox_worker = OutboxWorker(
+            self.delivery, self.outbox, latency=self.latency, alerts=alerts, shards=self.shards
+        )
+        self.retention = DeliveredRetention(front=alerts.front)
+        self._warm_task: Optional[asyncio.Task] = None
+        # first Poll API page, fetched while the rest of the app was starting (unacked, so safe to drop)
+        self._first_page = first_page
+        if first_page is not None:
+            first_page.add_done_callback(lambda f: f.cancelled() or f.exception())
         self._task: Optional[asyncio.Task] = None
         self._stopped = asyncio.Event()
+        self.scheduler = PollScheduler()
+        self.journal: Optional[EventJournal] = None
+        self.journal_consumer: Optional[JournalConsumer] = None
+        if settings.journal_dir:
+            self.journal = EventJournal()
+            self.journal_consumer = JournalConsumer(self.journal, self.process_page, batch_size=self.scheduler.page_size)
         # metrics
         self.processed_total = 0
         self.sent_total = 0
@@ -34,141 +156,277 @@ class Poller:
         self.last_cycle_latency = 0.0
         self.last_cycle_processed = 0
         self.last_cycle_sent = 0
-        # simple name info cache for enrichment
-        self._name_cache: dict[str, tuple[float, dict]] = {}
-        self._cache_ttl = 300  # seconds
+        self.last_cycle_enqueued = 0
+        self.current_interval = float(self.scheduler.base_interval)
+        self.lag_seconds = 0.0
         # buffer recent domains for quick testing UX
         self.recent_events = deque(maxlen=20)
-
-    async def _get_name_info_cached(self, name: str) -> dict:
-        now = time.time()
-        ent = self._name_cache.get(name)
-        if ent and now - ent[0] < self._cache_ttl:
-            return ent[1]
-        try:
-            info = await self.client.get_name_info(name)
-        except Exception:
-            info = {}
-        self._name_cache[name] = (now, info or {})
-        return info or {}
+        NAME_CACHE_SIZE.set_function(lambda: len(self.name_cache))
+        if self.journal is not None:
+            JOURNAL_BACKLOG_BYTES.set_function(self.journal.backlog_bytes)
+            for queue in ("queued", "in_flight", "awaiting_commit"):
+                PIPELINE_QUEUE_DEPTH.labels(queue).set_function(
+                    lambda q=queue: self.journal_consumer.stats()[q]
+                )
+        RECENT_EVENTS_SIZE.set_function(lambda: len(self.recent_events))
 
     async def start(self) -> None:
+        if self.journal is not None and self.lease.ttl > 0:
+            await ensure_shared(self.journal, self.lease.owner)
+        await self.lease.start()
+        if not self.lease.is_leader:
+            startup.mark("poller")
+            self._drop_first_page()
+        if self.shards is not None:
+            await self.shards.start()
+        await self.outbox_worker.start()
+
+    def _drop_first_page(self) -> None:
+        if self._first_page is not None:
+            self._first_page.cancel()
+            self._first_page = None
+
+    async def stop(self) -> None:
+        self._drop_first_page()
+        await self.lease.stop()
+        if self.shards is not None:
+            await self.shards.stop()
+        await self.outbox_worker.stop()
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+        await self.name_cache.close()
+        await self.client.close()
+
+    async def _lead(self) -> None:
+        """Leader duties: poll and ack the feed, consume the journal, prune delivered ids."""
+        # the previous leader delivered ids this process never saw: drop the Bloom filter so
+        # SQLite answers until it is rebuilt in the background
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+        self.alerts.front.invalidate()
+        self._warm_task = asyncio.create_task(self.alerts.front.warm(), name="dedupe_warm")
+        if self.journal is not None and self.journal_consumer is not None:
+            await asyncio.to_thread(self.journal.open)
+            await self.journal_consumer.start()
         if self._task is None or self._task.done():
             self._stopped.clear()
             self._task = asyncio.create_task(self._run(), name="doma_poller")
+        await self.retention.start()
 
-    async def stop(self) -> None:
+    async def _unlead(self) -> None:
         self._stopped.set()
         if self._task:
             await self._task
-        await self.client.close()
+            self._task = None
+        if self.journal is not None and self.journal_consumer is not None:
+            await self.journal_consumer.stop()
+            self.journal.close()
+        await self.retention.stop()
 
     async def _run(self) -> None:
-        interval = max(3, settings.poll_interval_seconds)
         kind = settings.doma_event_kind
         logger.info(
-            "Poller started: interval=%ss kind=%s simulate=%s dry_run=%s",
-            interval,
+            "Poller started: page_size=%d interval=%ss..%ss kind=%s simulate=%s dry_run=%s",
+            self.scheduler.page_size,
+            self.scheduler.min_interval,
+            self.scheduler.max_interval,
             kind,
             settings.doma_simulate,
             settings.alerts_dry_run,
         )
         while not self._stopped.is_set():
-            start = time.perf_counter()
+            if not self.lease.is_leader:
+                # lease not renewed in time: stop acking until it is renewed or handed over
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.lease.renew_every)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.journal is not None and self.journal.backlog_bytes() > settings.journal_max_backlog_bytes:
+                # backpressure: the consumer pipeline is behind, stop pulling pages until it catches up
+                self.journal_consumer.notify()
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.scheduler.min_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            fetched, acked = 0, False
             try:
-                events = await self.client.get_events(kind=kind, limit=20)
-                sent = 0
-                processed = 0
-                last_id: int | None = None
-                for ev in events:
-                    # Poll API shape
-                    ev_id_num = ev.get("id")
-                    ev_unique = str(ev.get("uniqueId"))
-                    ev_type = str(ev.get("type", ""))
-                    domain = str(ev.get("name", ""))
-                    if ev_id_num is not None:
-                        try:
-                            last_id = int(ev_id_num)
-                        except Exception:
-                            pass
-                    if not ev_unique or not domain:
-                        continue
-                    # dedupe on uniqueId per docs
-                    if await self.alerts.was_delivered(ev_unique):
-                        self.deduped_total += 1
-                        continue
-                    score = heuristic_score(domain)
-                    cta = f"https://start.doma.xyz/?domain={domain}"
-                    # enrichment via Subgraph (best-effort)
-                    enrich = await self._get_name_info_cached(domain)
-                    expires = (enrich or {}).get("expiresAt")
-                    owner = None
-                    toks = (enrich or {}).get("tokens") or []
-                    if toks:
-                        owner = (toks[0] or {}).get("ownerAddress")
-                    lines = [
-                        f"Score: {score}",
-                        f"UniqueID: {ev_unique}",
-                    ]
-                    if expires:
-                        lines.append(f"ExpiresAt: {expires}")
-                    if owner:
-                        lines.append(f"Owner: {owner}")
-                    lines.append(f"CTA: {cta}")
-                    text = self.alerts.format_alert(
-                        title=f"{ev_type} — {domain}",
-                        lines=lines,
-                    )
-                    # fan-out: alias-aware matching (LISTED/PURCHASED)
-                    recipients = await self.subs.list_all()
-                    alias = "PURCHASED" if "PURCHASED" in ev_type else ("LISTED" if "LISTED" in ev_type else ev_type)
-                    matched_users = set()
-                    for s in recipients:
-                        ft = (s.filter_text or "").upper()
-                        if ev_type in ft or alias in ft:
-                            matched_users.add(s.user_id)
-                    # push to recent buffer for UX
-                    try:
-                        self.recent_events.append({
-                            "type": ev_type,
-                            "name": domain,
-                            "uniqueId": ev_unique,
-                        })
-                    except Exception:
-                        pass
-                    if not matched_users:
-                        logger.debug("No matching subscribers for type=%s", ev_type)
-                    if settings.alerts_dry_run:
-                        logger.info("[DRY-RUN] Would send to %s: %s", list(matched_users), text.replace("\n", " | "))
-                    else:
-                        for uid in matched_users:
-                            try:
-                                await self.bot.send_message(chat_id=uid, text=text)
-                            except Exception:
-                                logger.exception("Failed to send to user_id=%s", uid)
-                        logger.info("Sent alert to %d users", len(matched_users))
-                    await self.alerts.mark_delivered(ev_unique)
-                    sent += 1
-                    processed += 1
-                # acknowledge last event id to receive next page
-                if last_id is not None:
-                    ok = await self.client.ack_events(last_id)
-                    self.last_ack_id = last_id
-                    if not ok:
-                        logger.warning("Failed to ack lastId=%s", last_id)
-                # metrics rollup
-                self.processed_total += processed
-                self.sent_total += sent
-                self.last_cycle_processed = processed
-                self.last_cycle_sent = sent
-                self.last_cycle_latency = time.perf_counter() - start
-                if sent or processed:
-                    logger.info(
-                        "Poller cycle: processed=%d sent=%d latency=%.3fs ack=%s",
-                        len(events), sent, self.last_cycle_latency, self.last_ack_id,
-                    )
+                fetched, acked = await self._poll_once(kind)
+                POLL_CYCLES.labels("ok").inc()
+                startup.mark("first_poll")
+                startup.mark("poller")
             except Exception as e:
                 self.error_total += 1
+                POLL_CYCLES.labels("error").inc()
                 logger.exception("Poller error: %s", e)
-            await asyncio.wait([self._stopped.wait()], timeout=interval)
+            delay = self.scheduler.next_delay(fetched, acked=acked)
+            self.current_interval = delay
+            if delay <= 0:
+                # drain mode: page came back full, fetch the next one right away
+                continue
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_once(self, kind: str) -> tuple[int, bool]:
+        """Fetch one page, journal (or process) it and ack. Returns (events fetched, acked)."""
+        start = time.perf_counter()
+        with POLL_STAGE_SECONDS.labels("fetch").time():
+            if self._first_page is not None:
+                first, self._first_page = self._first_page, None
+                events = await first
+            else:
+                events = await self.client.get_events(kind=kind, limit=self.scheduler.page_size)
+        fetched_at = time.time()
+        if self.journal is not None:
+            # durable first, so the ack never waits on enrichment or fan-out
+            with POLL_STAGE_SECONDS.labels("journal").time():
+                await self.journal.append(events, fetched_at)
+            if events:
+                self.journal_consumer.notify()
+        else:
+            await self.process_page(events, fetched_at)
+        # acknowledge last event id to receive next page
+        acked = True
+        last_id = _last_event_id(events)
+        if last_id is not None:
+            with POLL_STAGE_SECONDS.labels("ack").time():
+                acked = await self.client.ack_events(last_id)
+            self.last_ack_id = last_id
+            if not acked:
+                logger.warning("Failed to ack lastId=%s", last_id)
+        created = [_parse_ts((ev.get("eventData") or {}).get("createdAt")) for ev in events]
+        newest_created = max((c for c in created if c is not None), default=None)
+        # an empty page means we are caught up with the feed
+        if not events:
+            self.lag_seconds = 0.0
+        elif newest_created is not None:
+            self.lag_seconds = max(0.0, time.time() - newest_created)
+        self.last_cycle_latency = time.perf_counter() - start
+        POLL_CYCLE_SECONDS.observe(self.last_cycle_latency)
+        if events:
+            logger.info(
+                "Poller cycle: fetched=%d latency=%.3fs ack=%s",
+                len(events), self.last_cycle_latency, self.last_ack_id,
+            )
+        return len(events), acked
 
+    async def process_page(self, events: list[dict], fetched_at: Optional[float] = None) -> PageResult:
+        """Dedupe, enrich, score, match and hand one page of Poll API events to the outbox.
+
+        Does not fetch or ack, so recorded pages can be replayed through the same path.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        page = PageResult()
+        # dedupe the whole page with one query; marks are group-committed below
+        with POLL_STAGE_SECONDS.labels("dedupe").time():
+            delivered = await self.alerts.filter_delivered(
+                str(ev.get("uniqueId")) for ev in events if ev.get("uniqueId")
+            )
+        done: list[str] = []
+        jobs: list[tuple[str, int, str, Optional[dt.datetime]]] = []
+        digest_jobs: list[tuple[str, int, str, Optional[dt.datetime], int, int]] = []
+        # enrichment via Subgraph (best-effort), whole page in one or two round trips
+        with POLL_STAGE_SECONDS.labels("enrich").time():
+            enriched = await self.name_cache.get_many([
+                str(ev.get("name")) for ev in events
+                if ev.get("name") and str(ev.get("uniqueId")) not in delivered
+            ])
+        match_start = time.perf_counter()
+        # score the whole page at once; repeat names are served from the engine's LRU
+        names = [str(ev.get("name", "")) for ev in events]
+        scores = dict(zip(names, self.scorer.score_many(names)))
+        for ev in events:
+            # Poll API shape
+            ev_unique = str(ev.get("uniqueId"))
+            ev_type = str(ev.get("type", ""))
+            domain = str(ev.get("name", ""))
+            created = _parse_ts((ev.get("eventData") or {}).get("createdAt"))
+            if not ev_unique or not domain:
+                continue
+            # dedupe on uniqueId per docs
+            if ev_unique in delivered:
+                self.deduped_total += 1
+                POLL_EVENTS.labels("deduped").inc()
+                continue
+            score = scores[domain]
+            cta = f"https://start.doma.xyz/?domain={domain}"
+            enrich = enriched.get(domain) or {}
+            expires = (enrich or {}).get("expiresAt")
+            owner = None
+            toks = (enrich or {}).get("tokens") or []
+            if toks:
+                owner = (toks[0] or {}).get("ownerAddress")
+            lines = [
+                f"Score: {score}",
+                f"UniqueID: {ev_unique}",
+            ]
+            if expires:
+                lines.append(f"ExpiresAt: {expires}")
+            if owner:
+                lines.append(f"Owner: {owner}")
+            lines.append(f"CTA: {cta}")
+            text = self.alerts.format_alert(
+                title=f"{ev_type} — {domain}",
+                lines=lines,
+            )
+            # fan-out: compiled filters (type incl. LISTED/PURCHASED alias, tld, len, score, keywords)
+            index = await self.subs.get_index()
+            matched_users, digest_users = index.route(ev_type, domain, score)
+            if created is not None:
+                self.latency.record("chain_to_poll", fetched_at - created)
+            self.latency.record("poll_to_match", time.time() - fetched_at)
+            # push to recent buffer for UX
+            try:
+                self.recent_events.append({
+                    "type": ev_type,
+                    "name": domain,
+                    "uniqueId": ev_unique,
+                })
+            except Exception:
+                pass
+            if not matched_users and not digest_users:
+                logger.debug("No matching subscribers for type=%s", ev_type)
+            if settings.alerts_dry_run:
+                logger.info("[DRY-RUN] Would send to %s: %s", list(matched_users), text.replace("\n", " | "))
+                if digest_users:
+                    logger.info("[DRY-RUN] Would digest for %s: %s — %s", list(digest_users), ev_type, domain)
+            else:
+                created_dt = dt.datetime.fromtimestamp(created, dt.timezone.utc) if created is not None else None
+                jobs.extend((ev_unique, uid, text, created_dt) for uid in matched_users)
+                if digest_users:
+                    line = f"{ev_type} — {domain} | Score: {score} | {cta}"
+                    digest_jobs.extend(
+                        (ev_unique, uid, line, created_dt, window, count)
+                        for uid, (window, count) in digest_users.items()
+                    )
+            delivered.add(ev_unique)
+            done.append(ev_unique)
+            page.sent += 1
+            page.processed += 1
+        POLL_STAGE_SECONDS.labels("match").observe(time.perf_counter() - match_start)
+        # hand fan-out to the outbox; rows and delivered marks commit together
+        with POLL_STAGE_SECONDS.labels("mark").time():
+            page.enqueued, fresh = await self.outbox.enqueue(jobs, done, digest_jobs)
+        self.alerts.remember_delivered(done)
+        if len(fresh) < len(done):
+            # marked meanwhile by a concurrent batch (e.g. a page re-polled after a failed ack)
+            raced = len(done) - len(fresh)
+            self.deduped_total += raced
+            POLL_EVENTS.labels("deduped").inc(raced)
+            page.processed -= raced
+            page.sent -= raced
+        if jobs or digest_jobs:
+            logger.info(
+                "Enqueued %d messages and %d digest lines for %d events", len(jobs), len(digest_jobs), len(done)
+            )
+            self.outbox_worker.notify()
+        self.last_cycle_enqueued = page.enqueued
+        self.last_cycle_processed = page.processed
+        self.last_cycle_sent = page.sent
+        self.processed_total += page.processed
+        self.sent_total += page.sent
+        POLL_EVENTS.labels("processed").inc(page.processed)
+        return page
@@ -1,16 +1,143 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import logging
+import math
+from collections import Counter
+from functools import lru_cache
+from itertools import repeat
+from operator import add
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from infra.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Built-in vocabulary for dictionary and compound-name bonuses; SCORE_WORDS_FILE adds more.
+_WORDS = """
+ace act age air all ant app arc art bank bar base bay bee best bet big bit blue boat bold bond book box
+bright build buy cake call camp car card care cash cat chain chat city cloud club coin cool core crypto
+cup cyber dao data date day deal dev dex digital dog door dream drop earth easy eco edge energy eye face
+fair fan farm fast fire fish fit flow fly food fox free fun fund game gas gem gift go gold good green
+grid grow hash health heart help hero hill home hot house hub ice idea info ink iron jet job joy key kid
+king lab land law layer lead life light line link lion live loan lock logo love luck mail map market
+mart max media meta mind mint money moon name net news next nft node nova one open page pay peak pet
+pixel plan play plus pod point pool port pro pulse quest rain ray real red rent ride ring rock room root
+run safe sale sea secure seed shop sky smart snap social sol soft space spark star stack stake store
+sun super swap tap tax team tech time token top tour town trade tree true trust vault verse vision vote
+wallet wave way web well wild win wind wise wolf word work world yield zen zone
+""".split()
+
+# Heavier for TLDs with a deeper secondary market
+_TLD_WEIGHTS: Dict[str, int] = {
+    "com": 3, "ai": 3, "io": 2, "xyz": 1, "app": 2, "net": 1, "org": 1, "co": 1,
+    "dev": 1, "eth": 2, "crypto": 1, "nft": 1, "dao": 1, "bet": 1,
+}
+
+# Unseen bigrams score as if seen once in a corpus this much larger than the word list
+_UNSEEN_SMOOTHING = 10.0
+
+
+class ScoringEngine:
+    """Domain-name scoring with tables built once at startup and an LRU over repeat names.
+
+    The base points are the original heuristic (short, numeric, repeated-letter and
+    mixed names). On top of that come a dictionary-word or two-word-compound bonus from a
+    prefix trie, a pronounceability bonus from letter-bigram frequencies, and a TLD weight.
+    """
+
+    def __init__(self, words: Optional[Iterable[str]] = None, cache_size: Optional[int] = None) -> None:
+        vocab = {w.strip().lower() for w in (words if words is not None else _load_words()) if len(w.strip()) >= 2}
+        self.words = frozenset(vocab)
+        # flattened trie: every prefix of a word -> whether that prefix is itself a word
+        self._trie: Dict[str, bool] = {}
+        for word in vocab:
+            for i in range(1, len(word) + 1):
+                prefix = word[:i]
+                self._trie[prefix] = self._trie.get(prefix, False) or i == len(word)
+        counts = Counter(a + b for w in vocab for a, b in zip(w, w[1:]))
+        total = sum(counts.values()) or 1
+        self._bigrams: Dict[str, float] = {bg: math.log(n / total) for bg, n in counts.items()}
+        self._unseen = math.log(1.0 / (total * _UNSEEN_SMOOTHING))
+        # a name reads as pronounceable when its bigrams are as common as a typical dictionary word's
+        word_scores = sorted(self._bigram_avg(w) for w in vocab if len(w) >= 3)
+        self.pronounceable_at = word_scores[len(word_scores) // 4] if word_scores else self._unseen
+        self.cache_size = cache_size if cache_size is not None else settings.score_cache_size
+        self._cached = lru_cache(maxsize=max(0, self.cache_size))(self._compute)
+
+    def _bigram_avg(self, name: str) -> float:
+        if len(name) < 2:
+            return self._unseen
+        return sum(map(self._bigrams.get, map(add, name, name[1:]), repeat(self._unseen))) / (len(name) - 1)
+
+    def _word_ends(self, name: str, start: int) -> Iterator[int]:
+        trie = self._trie
+        for end in range(start + 1, len(name) + 1):
+            is_word = trie.get(name[start:end])
+            if is_word is None:
+                return
+            if is_word:
+                yield end
+
+    def _compute(self, domain: str) -> int:
+        label, _, tld = domain.lower().partition(".")
+        tld = tld.rsplit(".", 1)[-1]
+        n = len(label)
+        score = 0
+        if n <= 4:
+            score += 3
+        if label.isdigit():
+            score += 2
+        alpha = label.isalpha()
+        if alpha and len(set(label)) <= 2:
+            score += 1
+        if not alpha and any(c.isdigit() for c in label) and any(c.isalpha() for c in label):
+            score += 1
+        if alpha and n >= 3:
+            if label in self.words:
+                score += 3
+            elif any(end < n and label[end:] in self.words for end in self._word_ends(label, 0)):
+                score += 2
+            elif n >= 5 and self._bigram_avg(label) >= self.pronounceable_at:
+                score += 1
+        if "-" in label:
+            score -= 1
+        score += _TLD_WEIGHTS.get(tld, 0)
+        return max(0, score)
+
+    def score(self, domain: str) -> int:
+        return self._cached(domain)
+
+    def score_many(self, domains: Iterable[str]) -> List[int]:
+        """Scores in input order; repeats inside the batch and across batches hit the LRU."""
+        return list(map(self._cached, domains))
+
+    def stats(self) -> dict:
+        info = self._cached.cache_info()
+        return {"words": len(self.words), "cache": info.currsize, "hits": info.hits, "misses": info.misses}
+
+
+def _load_words() -> List[str]:
+    words = list(_WORDS)
+    path = settings.score_words_file
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                words.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        except OSError as e:
+            logger.warning("Cannot read SCORE_WORDS_FILE=%s: %s", path, e)
+    return words
+
+
+_engine: Optional[ScoringEngine] = None
+
+
+def get_scoring_engine() -> ScoringEngine:
+    """Process-wide engine; tables are built on first use."""
+    global _engine
+    if _engine is None:
+        _engine = ScoringEngine()
+    return _engine
 
 
 def heuristic_score(domain: str) -> int:
-    name = domain.split(".")[0].lower()
-    score = 0
-    if len(name) <= 4:
-        score += 3
-    if name.isdigit():
-        score += 2
-    if name.isalpha() and len(set(name)) <= 2:
-        score += 1
-    if any(c.isdigit() for c in name) and any(c.isalpha() for c in name):
-        score += 1
-    return score
+    return get_scoring_engine().score(domain)
@@ -1,11 +1,135 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from typing import List
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from data.models import add_subscription as db_add_subscription
 from data.models import list_subscriptions as db_list_subscriptions
 from data.models import delete_subscription as db_delete_subscription, Subscription
 from data.models import list_all_subscriptions as db_list_all
+from data.models import bump_setting, get_setting
+from features.filters import CompiledFilter, FilterMatcher, compile_stored, iter_bits, parse_filter, split_domain
+from features.scoring import heuristic_score
+from infra.config import settings
+
+
+def event_alias(ev_type: str) -> str:
+    return "PURCHASED" if "PURCHASED" in ev_type else ("LISTED" if "LISTED" in ev_type else ev_type)
+
+
+class SubscriptionIndex:
+    """In-memory match index over every subscription's compiled filter.
+
+    Each subscription takes a slot in a FilterMatcher, so one event is checked against
+    all filters with a few index lookups instead of a loop over subscriptions.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        # settings-table change counter this index was loaded at, and when it was last compared
+        self.version: Optional[str] = None
+        self.checked_at = 0.0
+        self._matcher = FilterMatcher()
+        # sub_id -> slot; slot -> (sub_id, user_id, filter)
+        self._slots: Dict[int, int] = {}
+        self._entries: List[Optional[Tuple[int, int, CompiledFilter]]] = []
+        self._free: List[int] = []
+        # slots of digest-mode subscriptions
+        self._digest_mask = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def load(self, subs: Iterable[Subscription]) -> None:
+        self._matcher = FilterMatcher()
+        self._slots.clear()
+        self._entries.clear()
+        self._free.clear()
+        self._digest_mask = 0
+        for s in subs:
+            self.add(s.id, s.user_id, compile_stored(s.filter_text, s.filter_compiled))
+        self.loaded = True
+
+    def add(self, sub_id: int, user_id: int, flt: CompiledFilter) -> None:
+        self.remove(sub_id)
+        if self._free:
+            slot = self._free.pop()
+            self._entries[slot] = (sub_id, user_id, flt)
+        else:
+            slot = len(self._entries)
+            self._entries.append((sub_id, user_id, flt))
+        self._slots[sub_id] = slot
+        self._matcher.add(slot, flt)
+        if flt.digest:
+            self._digest_mask |= 1 << slot
+
+    def remove(self, sub_id: int) -> None:
+        slot = self._slots.pop(sub_id, None)
+        if slot is None:
+            return
+        entry = self._entries[slot]
+        self._entries[slot] = None
+        self._free.append(slot)
+        self._digest_mask &= ~(1 << slot)
+        if entry is not None:
+            self._matcher.remove(slot, entry[2])
+
+    def route(
+        self, ev_type: str, domain: str = "", score: Optional[int] = None
+    ) -> Tuple[Set[int], Dict[int, Tuple[int, int]]]:
+        """Returns (users to alert now, {user: (digest window seconds, digest count)}).
+
+        A user with any matching immediate subscription gets the alert immediately; otherwise
+        the tightest window/count among their matching digest subscriptions applies.
+        """
+        alias = event_alias(ev_type)
+        name, tld = split_domain(domain)
+        if score is None:
+            score = heuristic_score(domain)
+        mask = self._matcher.match((ev_type, alias), name, tld, score)
+        entries = self._entries
+        immediate = {entries[slot][1] for slot in iter_bits(mask & ~self._digest_mask)}
+        digest: Dict[int, Tuple[int, int]] = {}
+        for slot in iter_bits(mask & self._digest_mask):
+            _, user_id, flt = entries[slot]
+            if user_id in immediate:
+                continue
+            window = flt.digest_window or settings.digest_window_seconds
+            count = flt.digest_count or settings.digest_max_items
+            current = digest.get(user_id)
+            digest[user_id] = (window, count) if current is None else (min(current[0], window), min(current[1], count))
+        return immediate, digest
+
+    def match(self, ev_type: str, domain: str = "", score: Optional[int] = None) -> Set[int]:
+        immediate, digest = self.route(ev_type, domain, score)
+        return immediate | digest.keys()
+
+
+# Shared by every SubscriptionsService instance (bot handlers and poller)
+_index = SubscriptionIndex()
+# Bumped on every add/delete so replicas notice subscriptions changed through another process
+_VERSION_KEY = "subscriptions_version"
+_VERSION_CHECK_SECONDS = 2.0
+_index_lock: Optional[asyncio.Lock] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _index_lock
+    if _index_lock is None:
+        _index_lock = asyncio.Lock()
+    return _index_lock
+
+
+def _follow_version(version: str) -> None:
+    """After a local change bumped the counter to ``version``, keep the index current without a reload.
+
+    Only when no other change came in between (the counter moved by exactly one); otherwise the
+    next version check reloads.
+    """
+    expected = str(int(version) - 1) if version != "1" else None
+    if _index.loaded and _index.version == expected:
+        _index.version = version
 
 
 class SubscriptionsService:
@@ -13,13 +137,42 @@ class SubscriptionsService:
         self.database_url = database_url
 
     async def add_subscription(self, user_id: int, filter_text: str) -> int:
-        return await db_add_subscription(user_id=user_id, filter_text=filter_text)
+        """Parse, store and index a filter; raises FilterSyntaxError for invalid filters."""
+        flt = parse_filter(filter_text)
+        sub_id = await db_add_subscription(user_id=user_id, filter_text=filter_text, filter_compiled=flt.to_json())
+        version = await bump_setting(_VERSION_KEY)
+        async with _get_lock():
+            if _index.loaded:
+                _index.add(sub_id, user_id, flt)
+                _follow_version(version)
+        return sub_id
 
     async def list_subscriptions(self, user_id: int) -> List[Subscription]:
         return await db_list_subscriptions(user_id=user_id)
 
     async def delete_subscription(self, user_id: int, sub_id: int) -> bool:
-        return await db_delete_subscription(user_id=user_id, sub_id=sub_id)
+        ok = await db_delete_subscription(user_id=user_id, sub_id=sub_id)
+        if ok:
+            version = await bump_setting(_VERSION_KEY)
+            async with _get_lock():
+                _index.remove(sub_id)
+                _follow_version(version)
+        return ok
 
     async def list_all(self) -> List[Subscription]:
         return await db_list_all()
+
+    async def get_index(self) -> SubscriptionIndex:
+        now = time.monotonic()
+        if _index.loaded and now - _index.checked_at < _VERSION_CHECK_SECONDS:
+            return _index
+        async with _get_lock():
+            if _index.loaded and now - _index.checked_at < _VERSION_CHECK_SECONDS:
+                return _index
+            version = await get_setting(_VERSION_KEY)
+            if not _index.loaded or version != _index.version:
+                # read the counter first: a change racing with the load is picked up next check
+                _index.load(await db_list_all())
+                _index.version = version
+            _index.checked_at = now
+        return _index
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from features.latency import RollingPercentiles
+from infra.config import settings
+from infra.metrics import WEBHOOK_QUEUE_DEPTH, WEBHOOK_UPDATE_SECONDS, WEBHOOK_UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Update fields that carry the chat (or user) an update belongs to
+_CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post", "business_message")
+_USER_FIELDS = ("callback_query", "inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query")
+
+
+def update_key(update: Dict[str, Any]) -> Any:
+    """Ordering key for a raw update: its chat id, else its sender, else the update itself."""
+    for field in _CHAT_FIELDS:
+        chat = (update.get(field) or {}).get("chat") or {}
+        if "id" in chat:
+            return chat["id"]
+    for field in _USER_FIELDS:
+        obj = update.get(field) or {}
+        chat = (obj.get("message") or {}).get("chat") or {}
+        if "id" in chat:
+            return chat["id"]
+        sender = obj.get("from") or {}
+        if "id" in sender:
+            return sender["id"]
+    return ("update", update.get("update_id"))
+
+
+def _fmt_ms(seconds: Optional[float]) -> str:
+    return "n/a" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Fast-ack webhook: queue the update, answer 200, handle it on a bounded worker pool.
+
+    Updates of one chat run one at a time in arrival order; different chats run in
+    parallel on up to ``workers`` tasks, so a slow command only holds up its own chat.
+    When ``queue_size`` updates are waiting, new ones get a 503 and Telegram redelivers
+    them later.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        **data: Any,
+    ) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.workers = max(1, workers or settings.webhook_workers)
+        self.queue_size = max(1, queue_size or settings.webhook_queue_size)
+        # chat -> updates not yet handled; a key stays while one of its updates is in flight
+        self._chats: Dict[Any, Deque[Tuple[float, Dict[str, Any]]]] = {}
+        # chats with an update ready to run and no update in flight
+        self._ready: asyncio.Queue[Any] = asyncio.Queue()
+        self._depth = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wait = RollingPercentiles(settings.latency_window_seconds, settings.latency_max_samples)
+        self._handle = RollingPercentiles(settings.latency_window_seconds, settings.latency_max_samples)
+        # metrics
+        self.in_flight = 0
+        self.handled_total = 0
+        self.rejected_total = 0
+        self.error_total = 0
+        WEBHOOK_QUEUE_DEPTH.set_function(lambda: self._depth)
+
+    def stats(self) -> dict:
+        wait = self._wait.percentiles(0.5, 0.95)
+        handle = self._handle.percentiles(0.5, 0.95)
+        return {
+            "queued": self._depth,
+            "in_flight": self.in_flight,
+            "handled": self.handled_total,
+            "rejected": self.rejected_total,
+            "errors": self.error_total,
+            "wait_p50/p95": f"{_fmt_ms(wait[0.5])}/{_fmt_ms(wait[0.95])}",
+            "handle_p50/p95": f"{_fmt_ms(handle[0.5])}/{_fmt_ms(handle[0.95])}",
+        }
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"webhook_worker_{i}") for i in range(self.workers)]
+
+    async def close(self, drain_seconds: float = 10.0) -> None:
+        """Finish queued updates (Telegram already got its 200 for them), then close the bot session."""
+        if self._tasks:
+            deadline = time.monotonic() + drain_seconds
+            while (self._depth or self.in_flight) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            if self._depth:
+                logger.warning("Webhook closing with %d updates unhandled", self._depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await super().close()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if self._depth >= self.queue_size:
+            self.rejected_total += 1
+            WEBHOOK_UPDATES.labels("rejected").inc()
+            return web.Response(status=503, text="busy")
+        key = update_key(update)
+        pending = self._chats.get(key)
+        if pending is None:
+            self._chats[key] = deque([(time.monotonic(), update)])
+            self._ready.put_nowait(key)
+        else:
+            # the chat is queued or busy; its worker picks this up after the earlier ones
+            pending.append((time.monotonic(), update))
+        self._depth += 1
+        WEBHOOK_UPDATES.labels("queued").inc()
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            pending = self._chats[key]
+            enqueued, update = pending.popleft()
+            self._depth -= 1
+            self.in_flight += 1
+            started = time.monotonic()
+            self._wait.add(started - enqueued)
+            WEBHOOK_UPDATE_SECONDS.labels("wait").observe(started - enqueued)
+            try:
+                await self._background_feed_update(bot=self.bot, update=update)
+                self.handled_total += 1
+                WEBHOOK_UPDATES.labels("handled").inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.error_total += 1
+                WEBHOOK_UPDATES.labels("error").inc()
+                logger.exception("Webhook update %s failed: %s", update.get("update_id"), e)
+            finally:
+                self.in_flight -= 1
+                elapsed = time.monotonic() - started
+                self._handle.add(elapsed)
+                WEBHOOK_UPDATE_SECONDS.labels("handle").observe(elapsed)
+                if pending:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
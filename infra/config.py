@@ -12,15 +12,98 @@ class Settings:
     # Default to testnet API per docs
     doma_base_url: str = os.getenv("DOMA_BASE_URL", "https://api-testnet.doma.xyz")
     doma_private_key_test: str = os.getenv("DOMA_PRIVATE_KEY_TEST", "")
+    # Shared HTTP pool for Doma API traffic
+    doma_http_max_connections: int = int(os.getenv("DOMA_HTTP_MAX_CONNECTIONS", "20"))
+    doma_http_max_keepalive: int = int(os.getenv("DOMA_HTTP_MAX_KEEPALIVE", "10"))
+    doma_http_keepalive_expiry: float = float(os.getenv("DOMA_HTTP_KEEPALIVE_EXPIRY", "30"))
+    doma_http2: bool = os.getenv("DOMA_HTTP2", "false").lower() in {"1", "true", "yes"}
+    doma_http_connect_timeout: float = float(os.getenv("DOMA_HTTP_CONNECT_TIMEOUT", "5"))
+    doma_http_read_timeout: float = float(os.getenv("DOMA_HTTP_READ_TIMEOUT", "10"))
+    doma_http_write_timeout: float = float(os.getenv("DOMA_HTTP_WRITE_TIMEOUT", "10"))
+    doma_http_pool_timeout: float = float(os.getenv("DOMA_HTTP_POOL_TIMEOUT", "5"))
+    # Circuit breaker per endpoint family and retry budget per window
+    doma_breaker_failures: int = int(os.getenv("DOMA_BREAKER_FAILURES", "5"))
+    doma_breaker_reset_seconds: float = float(os.getenv("DOMA_BREAKER_RESET_SECONDS", "30"))
+    doma_breaker_half_open_probes: int = int(os.getenv("DOMA_BREAKER_HALF_OPEN_PROBES", "1"))
+    doma_retry_max_tries: int = int(os.getenv("DOMA_RETRY_MAX_TRIES", "3"))
+    doma_retry_budget: int = int(os.getenv("DOMA_RETRY_BUDGET", "10"))
+    doma_retry_budget_window: float = float(os.getenv("DOMA_RETRY_BUDGET_WINDOW", "60"))
+    # Append every fetched Poll API page to this JSONL file (.gz compresses) for replay.py
+    doma_record_file: str = os.getenv("DOMA_RECORD_FILE", "")
     # API key/header for Doma HTTP calls (if required)
     doma_api_key: str = os.getenv("DOMA_API_KEY", "")
     doma_api_header: str = os.getenv("DOMA_API_HEADER", "Api-Key")
+    # SQLite profile applied on connect, and connection pool sizing
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    sqlite_mmap_size: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    sqlite_cache_size: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB
+    sqlite_pool_size: int = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+    sqlite_pool_overflow: int = int(os.getenv("SQLITE_POOL_OVERFLOW", "5"))
     debug: bool = os.getenv("DEBUG", "false").lower() in {"1", "true", "yes"}
     # D2 knobs
     poll_interval_seconds: int = int(os.getenv("POLL_INTERVAL_SECONDS", "15"))
+    # Adaptive polling: drain full pages immediately, otherwise interval within [min, max]
+    poll_page_size: int = int(os.getenv("POLL_PAGE_SIZE", "20"))
+    poll_min_interval_seconds: float = float(os.getenv("POLL_MIN_INTERVAL_SECONDS", "3"))
+    poll_max_interval_seconds: float = float(os.getenv("POLL_MAX_INTERVAL_SECONDS", "60"))
     doma_event_kind: str = os.getenv("DOMA_EVENT_KIND", "expiring")
     doma_simulate: bool = os.getenv("DOMA_SIMULATE", "true").lower() in {"1", "true", "yes"}
     alerts_dry_run: bool = os.getenv("ALERTS_DRY_RUN", "true").lower() in {"1", "true", "yes"}
+    # Telegram fan-out limits (~30 msg/s globally, ~1 msg/s per chat)
+    send_concurrency: int = int(os.getenv("SEND_CONCURRENCY", "16"))
+    tg_global_rate: float = float(os.getenv("TG_GLOBAL_RATE", "30"))
+    tg_per_chat_interval: float = float(os.getenv("TG_PER_CHAT_INTERVAL", "1.0"))
+    send_max_attempts: int = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+    # Outbox delivery workers
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+    outbox_idle_seconds: float = float(os.getenv("OUTBOX_IDLE_SECONDS", "1.0"))
+    # Write-ahead journal of raw poll pages ("" disables: process pages inline before ack)
+    journal_dir: str = os.getenv("JOURNAL_DIR", "journal")
+    journal_segment_bytes: int = int(os.getenv("JOURNAL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+    journal_fsync: bool = os.getenv("JOURNAL_FSYNC", "true").lower() in {"1", "true", "yes"}
+    # Polling pauses while this many journaled bytes are unconsumed
+    journal_max_backlog_bytes: int = int(os.getenv("JOURNAL_MAX_BACKLOG_BYTES", str(64 * 1024 * 1024)))
+    # Journal consumer pipeline: concurrent page workers, prefetched batches queued ahead of them
+    pipeline_workers: int = int(os.getenv("PIPELINE_WORKERS", "2"))
+    pipeline_queue_size: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+    # Replicas sharing one database: poller leader lease (0 disables election) and delivery shards
+    replica_id: str = os.getenv("REPLICA_ID", "")
+    leader_lease_seconds: float = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+    delivery_shards: int = int(os.getenv("DELIVERY_SHARDS", "1"))
+    # Digest subscriptions (digest:on): default window/count, and a cap per combined message
+    digest_window_seconds: int = int(os.getenv("DIGEST_WINDOW_SECONDS", "300"))
+    digest_max_items: int = int(os.getenv("DIGEST_MAX_ITEMS", "20"))
+    digest_message_chars: int = int(os.getenv("DIGEST_MESSAGE_CHARS", "3500"))
+    # Subgraph enrichment: names per GraphQL POST and concurrent POSTs per page
+    enrich_batch_size: int = int(os.getenv("ENRICH_BATCH_SIZE", "10"))
+    enrich_concurrency: int = int(os.getenv("ENRICH_CONCURRENCY", "4"))
+    # Shared name-info cache (LRU cap, hit/negative TTLs, stale-while-revalidate window)
+    name_cache_size: int = int(os.getenv("NAME_CACHE_SIZE", "5000"))
+    name_cache_ttl: float = float(os.getenv("NAME_CACHE_TTL", "300"))
+    name_cache_negative_ttl: float = float(os.getenv("NAME_CACHE_NEGATIVE_TTL", "30"))
+    name_cache_stale_seconds: float = float(os.getenv("NAME_CACHE_STALE_SECONDS", "600"))
+    # Persist name-info cache entries in SQLite (lazy read on miss, batched write-behind)
+    name_cache_persist: bool = os.getenv("NAME_CACHE_PERSIST", "true").lower() in {"1", "true", "yes"}
+    name_cache_flush_seconds: float = float(os.getenv("NAME_CACHE_FLUSH_SECONDS", "5"))
+    name_cache_flush_batch: int = int(os.getenv("NAME_CACHE_FLUSH_BATCH", "200"))
+    # /order_preview: currencies + fees per (chainId, contract, orderbook)
+    cta_market_cache_ttl: float = float(os.getenv("CTA_MARKET_CACHE_TTL", "600"))
+    # End-to-end alert latency (rolling window) and readiness SLO on p95
+    latency_window_seconds: float = float(os.getenv("LATENCY_WINDOW_SECONDS", "900"))
+    latency_max_samples: int = int(os.getenv("LATENCY_MAX_SAMPLES", "10000"))
+    alert_lag_slo_seconds: float = float(os.getenv("ALERT_LAG_SLO_SECONDS", "120"))
+    # delivered_alerts retention (0 days disables) and in-memory dedupe front
+    delivered_retention_days: int = int(os.getenv("DELIVERED_RETENTION_DAYS", "30"))
+    retention_batch_size: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+    retention_interval_seconds: float = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    dedupe_lru_size: int = int(os.getenv("DEDUPE_LRU_SIZE", "50000"))
+    dedupe_bloom_capacity: int = int(os.getenv("DEDUPE_BLOOM_CAPACITY", "1000000"))
+    dedupe_bloom_error_rate: float = float(os.getenv("DEDUPE_BLOOM_ERROR_RATE", "0.001"))
+    # Name scoring: LRU over repeat names, optional extra dictionary words (one per line)
+    score_cache_size: int = int(os.getenv("SCORE_CACHE_SIZE", "100000"))
+    score_words_file: str = os.getenv("SCORE_WORDS_FILE", "")
     # Poll API filters
     doma_event_types: str = os.getenv("DOMA_EVENT_TYPES", "NAME_TOKEN_LISTED")
     doma_finalized_only: bool = os.getenv("DOMA_FINALIZED_ONLY", "true").lower() in {"1", "true", "yes"}
@@ -29,5 +112,9 @@ class Settings:
     tg_webhook_base: str = os.getenv("TG_WEBHOOK_BASE", "")  # e.g., https://doma-bot-alert.onrender.com
     tg_webhook_path: str = os.getenv("TG_WEBHOOK_PATH", "tg-webhook")
     tg_webhook_secret: str = os.getenv("TG_WEBHOOK_SECRET", "")
+    # Webhook updates are acked at once and handled by this many workers (one chat at a time each);
+    # beyond queue_size waiting updates Telegram gets a 503 and redelivers
+    webhook_workers: int = int(os.getenv("WEBHOOK_WORKERS", "8"))
+    webhook_queue_size: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
 
 settings = Settings()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import logging
+import os
+import time
+from typing import Dict, Set
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+POLL_CYCLES = Counter("doma_poll_cycles_total", "Poll cycles run", ["result"])
+POLL_EVENTS = Counter("doma_poll_events_total", "Poll API events seen", ["outcome"])
+POLL_STAGE_SECONDS = Histogram(
+    "doma_poll_stage_seconds",
+    "Time spent per poll cycle stage (fetch, journal, dedupe, enrich, match, mark, ack, send)",
+    ["stage"],
+    buckets=_STAGE_BUCKETS,
+)
+POLL_CYCLE_SECONDS = Histogram("doma_poll_cycle_seconds", "Whole poll cycle latency", buckets=_STAGE_BUCKETS)
+MESSAGES = Counter("doma_messages_total", "Telegram sends by result", ["result"])
+DIGESTED_ALERTS = Counter("doma_digested_alerts_total", "Alerts folded into digest messages")
+HTTP_REQUEST_SECONDS = Histogram(
+    "doma_http_request_seconds",
+    "DomaClient request duration per endpoint family",
+    ["family", "outcome"],
+    buckets=_STAGE_BUCKETS,
+)
+ALERT_LATENCY_SECONDS = Histogram(
+    "doma_alert_latency_seconds",
+    "Alert latency per leg (chain_to_poll, poll_to_match, match_to_delivered, end_to_end, digest_delivery)",
+    ["leg"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0),
+)
+NAME_CACHE_SIZE = Gauge("doma_name_cache_entries", "Entries in the shared name-info cache")
+JOURNAL_BACKLOG_BYTES = Gauge("doma_journal_backlog_bytes", "Journaled event bytes not yet consumed")
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "doma_pipeline_queue_depth",
+    "Journal consumer pipeline depth per stage (queued, in_flight, awaiting_commit)",
+    ["queue"],
+)
+WEBHOOK_UPDATES = Counter("doma_webhook_updates_total", "Telegram webhook updates by outcome", ["outcome"])
+WEBHOOK_UPDATE_SECONDS = Histogram(
+    "doma_webhook_update_seconds",
+    "Webhook update time queued (wait) and in the dispatcher (handle)",
+    ["phase"],
+    buckets=_STAGE_BUCKETS,
+)
+WEBHOOK_QUEUE_DEPTH = Gauge("doma_webhook_queue_depth", "Webhook updates queued and not yet handled")
+RECENT_EVENTS_SIZE = Gauge("doma_recent_events", "Entries in the poller's recent_events buffer")
+STARTUP_SECONDS = Gauge("doma_startup_seconds", "Seconds from process start to each startup milestone", ["milestone"])
+
+
+def _process_started() -> float:
+    """time.monotonic() at process start (interpreter startup included when /proc is available)."""
+    now = time.monotonic()
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            boot_uptime = float(f.read().split()[0])
+        return now - max(0.0, boot_uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return now
+
+
+class StartupClock:
+    """Logs each startup milestone once, and "healthy" once every expected milestone is reached."""
+
+    def __init__(self) -> None:
+        self.started = _process_started()
+        self.expected: Set[str] = set()
+        self.reached: Dict[str, float] = {}
+
+    def expect(self, *milestones: str) -> None:
+        self.expected.update(milestones)
+
+    def mark(self, milestone: str) -> None:
+        if milestone in self.reached:
+            return
+        elapsed = time.monotonic() - self.started
+        self.reached[milestone] = elapsed
+        STARTUP_SECONDS.labels(milestone).set(elapsed)
+        logger.info("Startup: %s after %.3fs", milestone, elapsed)
+        if self.expected and "healthy" not in self.reached and self.expected <= self.reached.keys():
+            self.mark("healthy")
+
+
+# Process-wide: main marks db/telegram/web, the poller marks first_poll/poller
+startup = StartupClock()
+
+
+def render() -> tuple[bytes, str]:
+    """Prometheus text exposition for the default registry: (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,34 +1,53 @@
 #!/usr/bin/env python3
 import os
 import asyncio
+import importlib
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message
-from aiohttp import web
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+# aiogram (and the poller, which needs it) is imported inside create_app, the aiohttp web
+# stack only by the entry points that serve HTTP
 from infra.config import settings
 from infra.logging import setup_logging
+from infra import metrics
+from infra.metrics import startup
 from data.models import init_db
+from features.filters import FilterSyntaxError
 from features.subscriptions import SubscriptionsService
 from features.alerts import AlertsService
 from features.cta import CTAService
-from features.scoring import heuristic_score
-from features.poller import Poller
+from features.scoring import get_scoring_engine, heuristic_score
+from features.latency import tracker as latency_tracker
+from doma.cache import NameInfoCache
+from doma.client import get_doma_client
 
 
-async def create_app() -> tuple[Bot, Dispatcher, Poller]:
+async def create_app() -> "tuple[Bot, Dispatcher, Poller]":
     setup_logging(debug=settings.debug)
+    # importing aiogram builds all of its types and takes seconds on a cold container: run it on a
+    # thread while the schema check and the first Poll API page (not acked yet) come in
+    stack = asyncio.create_task(asyncio.to_thread(importlib.import_module, "features.poller"))
+    # one HTTP pool per process, shared by poller, CTA and /name_info
+    client = get_doma_client()
+    first_page = asyncio.create_task(
+        client.get_events(kind=settings.doma_event_kind, limit=settings.poll_page_size)
+    )
     await init_db(settings.database_url)
+    startup.mark("db")
+    await stack
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.filters import CommandStart, Command
+    from aiogram.types import Message
+    from features.poller import Poller
 
     bot = Bot(token=settings.telegram_bot_token)
     dp = Dispatcher()
 
     subs = SubscriptionsService(settings.database_url)
     alerts = AlertsService()
-    cta = CTAService()
-    poller = Poller(bot=bot, alerts=alerts)
+    name_cache = NameInfoCache(client)
+    cta = CTAService(name_cache=name_cache, client=client)
+    poller = Poller(bot=bot, alerts=alerts, client=client, name_cache=name_cache, first_page=first_page)
 
     @dp.message(CommandStart())
     async def on_start(message: Message) -> None:
@@ -56,7 +75,11 @@ async def create_app() -> tuple[Bot, Dispatcher, Poller]:
             await message.answer("Usage: /sub_add <filter>")
             return
         flt = args[1].strip()
-        sid = await subs.add_subscription(user_id=message.from_user.id, filter_text=flt)
+        try:
+            sid = await subs.add_subscription(user_id=message.from_user.id, filter_text=flt)
+        except FilterSyntaxError as e:
+            await message.answer(f"Invalid filter: {e}\nExample: type:LISTED tld:ai len<=5 score>=3 name~crypto")
+            return
         await message.answer(f"Added subscription #{sid}: {flt}")
 
     @dp.message(Command("sub_list"))
@@ -196,7 +219,7 @@ async def create_app() -> tuple[Bot, Dispatcher, Poller]:
             return
         domain = args[1].strip()
         try:
-            info = await poller.client.get_name_info(domain)
+            info = await name_cache.get(domain)
             if not info:
                 await message.answer("No Subgraph data for this name (testnet)")
                 return
@@ -216,23 +239,64 @@ async def create_app() -> tuple[Bot, Dispatcher, Poller]:
             await message.answer(f"Error: {e}")
 
     @dp.message(Command("alert_stats"))
-    async def on_alert_stats(message: Message) -> None:
+    async def on_alert_stats(message: Message, webhook_updates: "QueuedRequestHandler | None" = None) -> None:
         p = poller
+        w = poller.outbox_worker
+        pending = await poller.outbox.pending()
+        digest_pending = await poller.outbox.digest_pending()
         await message.answer(
             "Poller stats:\n"
             f"processed_total={p.processed_total} sent_total={p.sent_total} deduped_total={p.deduped_total} errors={p.error_total}\n"
-            f"last_ack_id={p.last_ack_id} last_cycle_processed={p.last_cycle_processed} last_cycle_sent={p.last_cycle_sent} latency={p.last_cycle_latency:.3f}s"
+            f"last_ack_id={p.last_ack_id} last_cycle_processed={p.last_cycle_processed} last_cycle_sent={p.last_cycle_sent} latency={p.last_cycle_latency:.3f}s\n"
+            f"delivered_total={p.delivery.delivered_total} throttled_total={p.delivery.throttled_total} send_failed_total={p.delivery.failed_total}\n"
+            f"lag={p.lag_seconds:.1f}s interval={p.current_interval:.1f}s draining={p.scheduler.draining} "
+            f"event_rate={(p.scheduler.rate or 0.0):.2f}/s page_size={p.scheduler.page_size}\n"
+            f"outbox_pending={pending} last_cycle_enqueued={p.last_cycle_enqueued}\n"
+            f"digest_buffered={digest_pending} digest_messages_total={w.digest_messages_total} "
+            f"digest_alerts_total={w.digest_items_total}\n"
+            f"last_batch_delivered={w.last_batch_delivered} last_batch_throttled={w.last_batch_throttled} send_rate={w.last_batch_rate:.1f}/s\n"
+            "name_cache: " + " ".join(f"{k}={v}" for k, v in name_cache.stats().items()) + "\n"
+            "journal: " + (" ".join(f"{k}={v}" for k, v in p.journal.stats().items()) if p.journal else "off") + "\n"
+            "replica: " + " ".join(f"{k}={v}" for k, v in p.lease.stats().items())
+            + ("" if p.shards is None else " shards=" + "{owned}/{total} members={members}".format(**p.shards.stats())) + "\n"
+            "webhook: " + (
+                " ".join(f"{k}={v}" for k, v in webhook_updates.stats().items()) if webhook_updates else "off"
+            ) + "\n"
+            "pipeline: " + (
+                " ".join(f"{k}={v}" for k, v in p.journal_consumer.stats().items()) if p.journal_consumer else "off"
+            ) + "\n"
+            "scoring: " + " ".join(f"{k}={v}" for k, v in get_scoring_engine().stats().items()) + "\n"
+            "http_pool: " + " ".join(f"{k}={v}" for k, v in client.pool_stats().items()) + "\n"
+            "latency p50/p95: " + " ".join(
+                f"{leg}={_fmt_s(v['p50'])}/{_fmt_s(v['p95'])}" for leg, v in latency_tracker.summary().items()
+            ) + "\n"
+            "dedupe: " + " ".join(f"{k}={v}" for k, v in alerts.front.stats().items())
+            + f" pruned_total={p.retention.pruned_total}\n"
+            "breakers: " + (" ".join(
+                f"{fam}={b['state']}({b['latency_ms']}ms,fail={b['failures']},open={b['opened']})"
+                for fam, b in client.breaker_stats().items()
+            ) or "n/a")
         )
 
     return bot, dp, poller
 
 
 async def run_webhook_and_poller() -> None:
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import setup_application
+    from features.webhook import QueuedRequestHandler
+
+    startup.expect("db", "telegram", "poller", "web")
     # Build app components
     bot, dp, poller = await create_app()
 
-    # Start poller in background
-    poller_task = asyncio.create_task(poller.start())
+    # Start the poller before serving: a failed start (e.g. JOURNAL_DIR not shared) must stop the process
+    try:
+        await poller.start()
+    except Exception:
+        await poller.stop()
+        await bot.session.close()
+        raise
 
     # Configure webhook routing
     app = web.Application()
@@ -247,10 +311,19 @@ async def run_webhook_and_poller() -> None:
     else:
         hook_path = f"/{path}"
 
-    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=hook_path)
+    # ack each update at once; a bounded worker pool runs the handlers, one chat at a time
+    updates = QueuedRequestHandler(dispatcher=dp, bot=bot)
+    updates.register(app, path=hook_path)
+    await updates.start()
+    dp["webhook_updates"] = updates
 
     # Register health endpoints
-    app.add_routes([web.get("/healthz", _health), web.get("/", _health)])
+    app.add_routes([
+        web.get("/healthz", _health),
+        web.get("/", _health),
+        web.get("/readyz", _ready),
+        web.get("/metrics", _metrics),
+    ])
 
     # Start web server
     runner = web.AppRunner(app)
@@ -258,11 +331,15 @@ async def run_webhook_and_poller() -> None:
     port = int(os.getenv("PORT", "10000"))
     site = web.TCPSite(runner, "0.0.0.0", port)
     await site.start()
+    startup.mark("web")
 
     # Set Telegram webhook
     base = settings.tg_webhook_base.rstrip("/")
     if base:
         await bot.set_webhook(url=f"{base}{hook_path}")
+    else:
+        await bot.me()
+    startup.mark("telegram")
 
     # Keep running
     try:
@@ -270,35 +347,68 @@ async def run_webhook_and_poller() -> None:
             await asyncio.sleep(3600)
     finally:
         await bot.delete_webhook(drop_pending_updates=False)
+        # drain queued updates while the shared Doma client and name cache are still open
+        await updates.close()
         await poller.stop()
-        await bot.session.close()
 
     return bot, dp, poller
 
 
 async def main() -> None:
+    startup.expect("db", "telegram", "poller")
     bot, dp, poller = await create_app()
     try:
-        await poller.start()
+        # the first poll (page usually prefetched already) and the Telegram handshake overlap;
+        # start_polling reuses the cached bot.me()
+        await asyncio.gather(poller.start(), bot.me())
+        startup.mark("telegram")
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await poller.stop()
         await bot.session.close()
 
 # Optional: expose a small health endpoint so Render Web Service stays green
-async def _health(request: web.Request) -> web.Response:
+async def _health(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
     return web.Response(text="ok")
 
+# Readiness: fails while p95 end-to-end alert lag exceeds ALERT_LAG_SLO_SECONDS
+async def _ready(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    ok, p95 = latency_tracker.ready()
+    body = f"{'ok' if ok else 'lagging'} p95_end_to_end={_fmt_s(p95)} slo={settings.alert_lag_slo_seconds:g}s"
+    return web.Response(text=body, status=200 if ok else 503)
+
+def _fmt_s(value: float | None) -> str:
+    return "n/a" if value is None else f"{value:.1f}s"
+
+async def _metrics(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    body, content_type = metrics.render()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
 async def run_web_and_bot() -> None:
+    from aiohttp import web
+
+    startup.expect("web")
     # Start bot in background (polling mode) and expose healthz
     bot_task = asyncio.create_task(main())
     app = web.Application()
-    app.add_routes([web.get("/healthz", _health), web.get("/", _health)])
+    app.add_routes([
+        web.get("/healthz", _health),
+        web.get("/", _health),
+        web.get("/readyz", _ready),
+        web.get("/metrics", _metrics),
+    ])
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.getenv("PORT", "10000"))
     site = web.TCPSite(runner, "0.0.0.0", port)
     await site.start()
+    startup.mark("web")
     await bot_task
 
 if __name__ == "__main__":
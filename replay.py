@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Replay recorded Poll API events through the poller's dedupe, score, match and format path.
+
+    python replay.py events.jsonl.gz --filter "type:LISTED tld:ai score>=4" --sink jsonl --out matches.jsonl
+
+Input is JSONL, optionally gzip-compressed. Each line holds one event in the DomaClient.get_events
+shape, or a whole Poll API response ({"events": [...]}). Recordings come from running the bot with
+DOMA_RECORD_FILE set. The file is streamed page by page. No Doma API or Telegram calls are made
+unless --enrich is given, in which case names are enriched from the live subgraph.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+from infra.config import settings
+
+logger = logging.getLogger("replay")
+
+
+def _is_gzip(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def iter_events(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if _is_gzip(path) else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping invalid JSON on line %d", lineno)
+                continue
+            if isinstance(obj, dict) and isinstance(obj.get("events"), list):
+                yield from (ev for ev in obj["events"] if isinstance(ev, dict))
+            elif isinstance(obj, dict):
+                yield obj
+
+
+def iter_pages(events: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(events)
+    while True:
+        page = list(islice(it, size))
+        if not page:
+            return
+        yield page
+
+
+class CountSink:
+    """Counts what would be sent; the default sink."""
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.digest_lines = 0
+        self.per_user: Counter = Counter()
+
+    async def enqueue(
+        self, rows: Iterable[Sequence], delivered_ids: Iterable[str], digest_rows: Iterable[Sequence] = ()
+    ) -> Tuple[int, Set[str]]:
+        n = 0
+        for row in rows:
+            self.per_user[row[1]] += 1
+            self.messages += 1
+            n += 1
+        for row in digest_rows:
+            self.per_user[row[1]] += 1
+            self.digest_lines += 1
+            n += 1
+        return n, set(delivered_ids)
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlSink(CountSink):
+    """Also writes every message and digest line as JSONL."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self._f = open(path, "w", encoding="utf-8")
+
+    async def enqueue(
+        self, rows: Iterable[Sequence], delivered_ids: Iterable[str], digest_rows: Iterable[Sequence] = ()
+    ) -> Tuple[int, Set[str]]:
+        rows, digest_rows = list(rows), list(digest_rows)
+        for row in rows:
+            self._f.write(json.dumps({"event_id": row[0], "user_id": row[1], "text": row[2]}, ensure_ascii=False) + "\n")
+        for row in digest_rows:
+            self._f.write(
+                json.dumps({"event_id": row[0], "user_id": row[1], "digest_line": row[2]}, ensure_ascii=False) + "\n"
+            )
+        return await super().enqueue(rows, delivered_ids, digest_rows)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class OfflineNameCache:
+    """Stand-in for NameInfoCache: no subgraph calls, alerts carry no enrichment."""
+
+    def __len__(self) -> int:
+        return 0
+
+    async def get_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        return {}
+
+    async def close(self) -> None:
+        pass
+
+
+async def _prepare_db(args: argparse.Namespace) -> None:
+    from data.models import init_db
+    from features.subscriptions import SubscriptionsService
+
+    if args.filter:
+        # throwaway database holding only the filters under test, one user per filter
+        settings.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="doma-replay-"), "replay.db")
+    elif args.db:
+        settings.database_url = f"sqlite:///{args.db}"
+    await init_db(settings.database_url)
+    subs = SubscriptionsService(settings.database_url)
+    for user_id, flt in enumerate(args.filter, 1):
+        await subs.add_subscription(user_id=user_id, filter_text=flt)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # the sink stands in for Telegram, so build real jobs instead of dry-run logging
+    settings.alerts_dry_run = False
+    settings.doma_simulate = False
+    await _prepare_db(args)
+
+    from features.alerts import AlertsService
+    from features.poller import Poller
+
+    if args.sink == "jsonl":
+        sink: Any = JsonlSink(args.out)
+    elif args.sink == "outbox":
+        from features.outbox import OutboxService
+
+        sink = OutboxService()
+    else:
+        sink = CountSink()
+    alerts = AlertsService()
+    # the delivery engine is never started, so no Bot is needed
+    poller = Poller(
+        bot=None,  # type: ignore[arg-type]
+        alerts=alerts,
+        name_cache=None if args.enrich else OfflineNameCache(),  # type: ignore[arg-type]
+        outbox=sink,
+    )
+    events = iter_events(args.path)
+    if args.limit:
+        events = islice(events, args.limit)
+    seen = pages = 0
+    start = time.perf_counter()
+    try:
+        for page in iter_pages(events, args.page_size):
+            await poller.process_page(page)
+            seen += len(page)
+            pages += 1
+            if args.progress and pages % args.progress == 0:
+                elapsed = time.perf_counter() - start
+                logger.warning("%d events in %.1fs (%.0f/s)", seen, elapsed, seen / elapsed if elapsed else 0.0)
+    finally:
+        elapsed = time.perf_counter() - start
+        if hasattr(sink, "close"):
+            sink.close()
+        await poller.name_cache.close()
+        await poller.client.close()
+    report: Dict[str, Any] = {
+        "events": seen,
+        "pages": pages,
+        "processed": poller.processed_total,
+        "deduped": poller.deduped_total,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(seen / elapsed, 1) if elapsed else 0.0,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if isinstance(sink, CountSink):
+        report["messages"] = sink.messages
+        report["digest_lines"] = sink.digest_lines
+        report["users"] = len(sink.per_user)
+        if args.filter:
+            # user ids were assigned per --filter, so per-user counts are per-filter counts
+            report["per_filter"] = {flt: sink.per_user.get(i, 0) for i, flt in enumerate(args.filter, 1)}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL or JSONL.gz file of Poll API events")
+    parser.add_argument("--filter", action="append", default=[],
+                        help="subscription filter to test (repeatable); uses a throwaway DB instead of --db")
+    parser.add_argument("--db", default="", help="SQLite file for subscriptions and dedupe (default: DATABASE_URL)")
+    parser.add_argument("--sink", choices=("count", "jsonl", "outbox"), default="count",
+                        help="count: report only; jsonl: write messages to --out; outbox: insert into the DB outbox")
+    parser.add_argument("--out", default="replay_out.jsonl", help="output file for --sink jsonl")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=0, help="stop after N events")
+    parser.add_argument("--enrich", action="store_true", help="enrich names from the live subgraph")
+    parser.add_argument("--progress", type=int, default=0, help="log progress every N pages")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    if args.sink == "outbox" and not args.db and not args.filter:
+        parser.error("--sink outbox writes to the bot's outbox; pass --db with a scratch database")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
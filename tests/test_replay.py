@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import socket
+
+import pytest
+
+import replay
+from infra.config import settings
+
+
+@pytest.fixture
+def network_calls(monkeypatch):
+    """Records (and refuses) every network call; enrichment swallows errors, so a raise alone is not enough."""
+    calls = []
+
+    def refuse(*args, **kwargs):
+        calls.append(args)
+        raise OSError("network disabled in tests")
+
+    # DNS comes first for httpx; raw connects cover anything dialling an IP directly
+    monkeypatch.setattr(socket, "getaddrinfo", refuse)
+    monkeypatch.setattr(socket.socket, "connect", refuse)
+    monkeypatch.setattr(socket.socket, "connect_ex", refuse)
+    for field in ("database_url", "alerts_dry_run", "doma_simulate", "journal_dir"):
+        monkeypatch.setattr(settings, field, getattr(settings, field))
+    settings.journal_dir = ""
+    return calls
+
+
+def test_replay_without_enrich_stays_offline(network_calls, tmp_path):
+    path = tmp_path / "events.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(1, 51):
+            f.write(json.dumps({
+                "id": i,
+                "uniqueId": f"ev-{i}",
+                "type": "NAME_TOKEN_LISTED",
+                "name": f"name{i}.ai",
+                "eventData": {"createdAt": "2025-01-01T00:00:00Z"},
+            }) + "\n")
+    args = argparse.Namespace(
+        path=str(path), filter=["type:LISTED tld:ai"], db="", sink="count", out="", page_size=20,
+        limit=0, enrich=False, progress=0,
+    )
+
+    report = asyncio.run(replay.run(args))
+
+    assert network_calls == []
+    assert report["events"] == 50
+    assert report["processed"] == 50
+    assert report["messages"] == 50